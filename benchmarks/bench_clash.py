@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Clash控制器测速后端本地验证
+
+在本机启动一个替身external-controller，实现 GET /version、PUT /configs 和
+GET /proxies/{name}/delay。替身按节点的server字段决定测速结果：正常返回延迟、
+超时返回504、返回非JSON或非对象的响应体。另外再启动secret不匹配（401）和
+/version返回非JSON的控制器，以及一个未监听的地址，检查clash_probe对每种情况
+的处理是否符合预期。
+
+用法: python benchmarks/bench_clash.py [--timeout 300]
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yaml
+import clash_probe
+
+SECRET = 'bench-secret'
+DELAY = 42
+
+def make_handler(secret=SECRET, version_body=None):
+    """返回替身控制器的请求处理类；version_body不为None时/version返回该原始内容"""
+    proxies = {}
+    
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+        
+        def _reply(self, status, body, content_type='application/json'):
+            data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        
+        def _authorized(self):
+            if self.headers.get('Authorization') == f"Bearer {secret}":
+                return True
+            self._reply(401, {'message': 'Unauthorized'})
+            return False
+        
+        def do_GET(self):
+            if not self._authorized():
+                return
+            url = urlparse(self.path)
+            if url.path == '/version':
+                if version_body is not None:
+                    self._reply(200, version_body, 'text/plain')
+                else:
+                    self._reply(200, {'version': 'bench-stand-in'})
+                return
+            parts = url.path.split('/')
+            if len(parts) != 4 or parts[1] != 'proxies' or parts[3] != 'delay':
+                self._reply(404, {'message': 'not found'})
+                return
+            proxy = proxies.get(unquote(parts[2]))
+            if proxy is None:
+                self._reply(404, {'message': 'resource not found'})
+                return
+            timeout = int(parse_qs(url.query).get('timeout', ['5000'])[0])
+            server = proxy.get('server')
+            if server == 'ok.test':
+                self._reply(200, {'delay': DELAY})
+            elif server == 'timeout.test':
+                # 与真实内核一致：等到测速超时后返回504
+                time.sleep(timeout / 1000)
+                self._reply(504, {'message': 'Timeout'})
+            elif server == 'text.test':
+                self._reply(200, 'not json', 'text/plain')
+            elif server == 'list.test':
+                self._reply(200, [DELAY])
+            else:
+                self._reply(200, {'delay': 0})
+        
+        def do_PUT(self):
+            if not self._authorized():
+                return
+            if urlparse(self.path).path != '/configs':
+                self._reply(404, {'message': 'not found'})
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            config = yaml.safe_load(body['payload'])
+            proxies.clear()
+            proxies.update((proxy['name'], proxy) for proxy in config.get('proxies', []))
+            self.send_response(204)
+            self.end_headers()
+    
+    return Handler
+
+def start(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def unused_url():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return f"http://127.0.0.1:{port}"
+
+def node(server):
+    return {'name': f"节点 {server}", 'type': 'trojan', 'server': server, 'port': 443,
+            'password': 'x', '_score': 10, 'latency': 10}
+
+def run_probe(base_url, nodes, timeout, secret=SECRET):
+    """返回 (结果列表或'ClashApiError', 耗时秒)"""
+    controller = clash_probe.ClashController(base_url, secret=secret, concurrency=4)
+    start_time = time.perf_counter()
+    try:
+        result = clash_probe.probe_nodes(nodes, controller=controller, timeout=timeout)
+    except clash_probe.ClashApiError as e:
+        result = 'ClashApiError'
+        print(f"    {str(e)[:80]}")
+    finally:
+        controller.close()
+    return result, time.perf_counter() - start_time
+
+def main():
+    parser = argparse.ArgumentParser(description='Clash控制器测速后端本地验证')
+    parser.add_argument('--timeout', type=int, default=300, help='单个节点测速超时（毫秒）')
+    args = parser.parse_args()
+    
+    servers = []
+    ok_server, ok_url = start(make_handler())
+    text_server, text_url = start(make_handler(version_body='<html>not json</html>'))
+    list_server, list_url = start(make_handler(version_body='[]'))
+    servers.extend([ok_server, text_server, list_server])
+    
+    nodes = [node(server) for server in ('ok.test', 'timeout.test', 'text.test', 'list.test', 'zero.test')]
+    cases = [
+        ('正常控制器', ok_url, nodes, SECRET, [DELAY, None, None, None, None]),
+        ('secret不正确（401）', ok_url, nodes[:1], 'wrong', 'ClashApiError'),
+        ('/version返回非JSON', text_url, nodes[:1], SECRET, 'ClashApiError'),
+        ('/version返回非对象JSON', list_url, nodes[:1], SECRET, 'ClashApiError'),
+        ('控制器未监听', unused_url(), nodes[:1], SECRET, 'ClashApiError'),
+    ]
+    
+    mismatches = 0
+    for label, base_url, case_nodes, secret, expected in cases:
+        print(f"  {label}:")
+        result, elapsed = run_probe(base_url, case_nodes, args.timeout, secret)
+        ok = result == expected
+        mismatches += not ok
+        print(f"  {'✓' if ok else '✗'} 预期 {expected} 实际 {result}（{elapsed:.2f}秒）")
+    
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    print(f"\n{len(cases) - mismatches}/{len(cases)} 个用例符合预期")
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+协议层（L7）测速本地验证
+
+在本机启动一个HTTP测速目标和若干替身代理服务端（trojan over TLS、
+trojan over TLS+WebSocket、vless over TCP/WebSocket、ss AEAD），替身服务端
+校验密码/UUID后把请求转发给测速目标。随后用l7_probe对正确配置、错误凭据、
+证书校验失败和不支持的节点各测一次，检查结果是否符合预期并输出延迟。
+
+trojan（自签名证书）和ss需要安装cryptography，未安装时跳过这些用例。
+
+用法: python benchmarks/bench_l7.py [--rounds 3]
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import ipaddress
+import os
+import ssl
+import struct
+import sys
+import tempfile
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import l7_probe
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+except ImportError:
+    x509 = None
+
+TROJAN_PASSWORD = 'trojan-password'
+VLESS_UUID = '6a0c5f5e-3a1f-4a53-9c5b-2f0ad1d4c0de'
+SS_PASSWORD = 'ss-password'
+SS_CIPHER = 'aes-256-gcm'
+
+class ServerStream:
+    """替身服务端一侧的连接，可选按WebSocket帧收发"""
+    
+    def __init__(self, reader, writer, websocket=False):
+        self.reader = reader
+        self.writer = writer
+        self.websocket = websocket
+        self.data = b''
+    
+    async def accept_websocket(self):
+        await self.reader.readuntil(b'\r\n\r\n')
+        self.writer.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n\r\n')
+        await self.writer.drain()
+    
+    async def _read_frame(self):
+        first, second = await self.reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length, = struct.unpack('!H', await self.reader.readexactly(2))
+        elif length == 127:
+            length, = struct.unpack('!Q', await self.reader.readexactly(8))
+        mask = await self.reader.readexactly(4) if second & 0x80 else b'\x00' * 4
+        payload = await self.reader.readexactly(length)
+        return bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    
+    async def readexactly(self, n):
+        if not self.websocket:
+            return await self.reader.readexactly(n)
+        while len(self.data) < n:
+            self.data += await self._read_frame()
+        result, self.data = self.data[:n], self.data[n:]
+        return result
+    
+    async def read_rest(self):
+        """读取已收到的剩余数据（请求头之后紧跟的HTTP请求）"""
+        if self.websocket:
+            if not self.data:
+                self.data = await self._read_frame()
+            result, self.data = self.data, b''
+            return result
+        return await self.reader.read(65536)
+    
+    async def write(self, data):
+        if self.websocket:
+            if len(data) < 126:
+                header = struct.pack('!BB', 0x82, len(data))
+            else:
+                header = struct.pack('!BBH', 0x82, 126, len(data))
+            data = header + data
+        self.writer.write(data)
+        await self.writer.drain()
+
+async def read_socks_address(stream):
+    atyp, = await stream.readexactly(1)
+    if atyp == 1:
+        host = '.'.join(str(b) for b in await stream.readexactly(4))
+    elif atyp == 3:
+        length, = await stream.readexactly(1)
+        host = (await stream.readexactly(length)).decode()
+    else:
+        host = str(ipaddress.ip_address(await stream.readexactly(16)))
+    port, = struct.unpack('!H', await stream.readexactly(2))
+    return host, port
+
+async def fetch(host, port, request):
+    """替身服务端转发请求到测速目标，返回完整响应"""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(request)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response
+
+def handler(protocol, websocket=False):
+    async def handle(reader, writer):
+        stream = ServerStream(reader, writer, websocket)
+        try:
+            if websocket:
+                await stream.accept_websocket()
+            if protocol == 'trojan':
+                line = await stream.readexactly(58)
+                if line[:56] != hashlib.sha224(TROJAN_PASSWORD.encode()).hexdigest().encode():
+                    return
+                await stream.readexactly(1)  # 命令
+                host, port = await read_socks_address(stream)
+                await stream.readexactly(2)
+                await stream.write(await fetch(host, port, await stream.read_rest()))
+            elif protocol == 'vless':
+                head = await stream.readexactly(17)
+                if head[1:] != uuid.UUID(VLESS_UUID).bytes:
+                    return
+                addons, = await stream.readexactly(1)
+                await stream.readexactly(addons + 1)
+                port, = struct.unpack('!H', await stream.readexactly(2))
+                atyp, = await stream.readexactly(1)
+                length = 4 if atyp == 1 else 16 if atyp == 3 else (await stream.readexactly(1))[0]
+                raw = await stream.readexactly(length)
+                host = raw.decode() if atyp == 2 else str(ipaddress.ip_address(raw))
+                response = await fetch(host, port, await stream.read_rest())
+                await stream.write(b'\x00\x00' + response)
+            else:
+                await handle_ss(stream)
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError, l7_probe.ProbeError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+async def handle_ss(stream):
+    """ss AEAD服务端：复用l7_probe中的加密流实现，密码不匹配时解密失败"""
+    class Adapter:
+        async def read(self):
+            return await stream.read_rest()
+        
+        async def write(self, data):
+            await stream.write(data)
+        
+        def close(self):
+            pass
+    
+    ss = l7_probe.ShadowsocksStream(Adapter(), SS_CIPHER, SS_PASSWORD)
+    buffer = l7_probe.BufferedStream(ss)
+    host, port = await read_socks_address(buffer)
+    await ss.write(await fetch(host, port, await buffer.read()))
+
+def self_signed_context(directory):
+    """生成自签名证书，返回服务端TLS上下文"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name)
+            .public_key(key.public_key()).serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    cert_file = os.path.join(directory, 'cert.pem')
+    key_file = os.path.join(directory, 'key.pem')
+    with open(cert_file, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_file, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert_file, key_file)
+    return context
+
+async def http_target(reader, writer):
+    await reader.readuntil(b'\r\n\r\n')
+    writer.write(b'HTTP/1.1 204 No Content\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+    await writer.drain()
+    writer.close()
+
+async def start(handle, ssl_context=None):
+    server = await asyncio.start_server(handle, '127.0.0.1', 0, ssl=ssl_context)
+    return server, server.sockets[0].getsockname()[1]
+
+async def build_cases(servers, directory):
+    """返回 [(说明, 节点, 预期)]，预期为 'pass'/'fail'/'unsupported'"""
+    cases = []
+    
+    async def add_server(handle, ssl_context=None):
+        server, port = await start(handle, ssl_context)
+        servers.append(server)
+        return port
+    
+    port = await add_server(handler('vless'))
+    base = {'type': 'vless', 'server': '127.0.0.1', 'port': port, 'uuid': VLESS_UUID, 'tls': False}
+    cases.append(('vless tcp', dict(base), 'pass'))
+    cases.append(('vless tcp 错误UUID', dict(base, uuid=str(uuid.uuid4())), 'fail'))
+    cases.append(('vless flow (xtls-rprx-vision)', dict(base, flow='xtls-rprx-vision'), 'unsupported'))
+    
+    port = await add_server(handler('vless', websocket=True))
+    cases.append(('vless ws', dict(base, port=port, network='ws', **{'ws-opts': {'path': '/ws'}}), 'pass'))
+    
+    cases.append(('vmess', {'type': 'vmess', 'server': '127.0.0.1', 'port': port, 'uuid': VLESS_UUID}, 'unsupported'))
+    cases.append(('vless 缺少uuid', {'type': 'vless', 'server': '127.0.0.1', 'port': port}, 'fail'))
+    
+    if x509 is None:
+        print("未安装cryptography，跳过trojan（TLS）和ss用例")
+        return cases
+    
+    tls = self_signed_context(directory)
+    port = await add_server(handler('trojan'), tls)
+    base = {'type': 'trojan', 'server': '127.0.0.1', 'port': port, 'password': TROJAN_PASSWORD,
+            'skip-cert-verify': True}
+    cases.append(('trojan tls', dict(base), 'pass'))
+    cases.append(('trojan tls 错误密码', dict(base, password='wrong'), 'fail'))
+    cases.append(('trojan tls 证书校验失败', dict(base, **{'skip-cert-verify': False}), 'fail'))
+    
+    port = await add_server(handler('trojan', websocket=True), tls)
+    cases.append(('trojan tls+ws', dict(base, port=port, network='ws', **{'ws-opts': {'path': '/ws'}}), 'pass'))
+    
+    port = await add_server(handler('ss'))
+    base = {'type': 'ss', 'server': '127.0.0.1', 'port': port, 'cipher': SS_CIPHER, 'password': SS_PASSWORD}
+    cases.append(('ss aes-256-gcm', dict(base), 'pass'))
+    cases.append(('ss 错误密码', dict(base, password='wrong'), 'fail'))
+    cases.append(('ss 非字符串密码', dict(base, password=12345), 'fail'))
+    return cases
+
+def outcome(result):
+    if result == l7_probe.UNSUPPORTED:
+        return 'unsupported'
+    return 'fail' if result is None else 'pass'
+
+async def run(rounds):
+    servers = []
+    with tempfile.TemporaryDirectory() as directory:
+        target, target_port = await start(http_target)
+        servers.append(target)
+        cases = await build_cases(servers, directory)
+        url = f"http://127.0.0.1:{target_port}/generate_204"
+        
+        samples = [[] for _ in cases]
+        for _ in range(rounds):
+            results = await l7_probe.probe_nodes([node for _, node, _ in cases], timeout=2, url=url)
+            for i, result in enumerate(results):
+                samples[i].append(result)
+    for server in servers:
+        server.close()
+    
+    mismatches = 0
+    for (label, _, expected), results in zip(cases, samples):
+        got = outcome(results[0])
+        consistent = all(outcome(result) == got for result in results)
+        ok = got == expected and consistent
+        mismatches += not ok
+        latencies = [result for result in results if isinstance(result, float)]
+        detail = f"  最快 {min(latencies):.2f}ms" if latencies else ''
+        print(f"  {'✓' if ok else '✗'} {label:<32} 预期 {expected:<12} 实际 {got}{detail}")
+    print(f"\n{len(cases) - mismatches}/{len(cases)} 个用例符合预期")
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description='协议层测速本地验证')
+    parser.add_argument('--rounds', type=int, default=3, help='每个用例的测速次数')
+    args = parser.parse_args()
+    
+    sys.exit(1 if asyncio.run(run(args.rounds)) else 0)
+
+if __name__ == "__main__":
+    main()
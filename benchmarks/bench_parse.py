@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代理链接解析性能测试
+
+在合成的 ss/vmess/trojan/vless/hysteria2 链接上比较旧版if/elif解析
+（legacy_parser.py，基线实现原样保留）、逐条 parse_proxy_url 与批量
+parse_proxy_urls 的吞吐量（行/秒），并检查新旧实现解析结果一致。
+
+用法: python benchmarks/bench_parse.py [--lines 100000] [--repeat 3]
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from proxy_parser import parse_proxy_url, parse_proxy_urls
+import legacy_parser
+
+def make_corpus(count, seed=1):
+    """生成合成订阅（各协议混合，参数组合有限，贴近真实订阅）"""
+    rng = random.Random(seed)
+    paths = ['/', '/ws', '/eyJqdW5rIjoiZTZGZzRZbFZWdUtwemEifQ%3D%3D?ed=2560', '/vless']
+    hosts = ['bfree.pages.dev', 'example.workers.dev', 'cdn.example.com']
+    lines = []
+    for i in range(count):
+        server = f"172.66.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+        port = rng.choice([443, 2053, 2083, 8443])
+        uuid = f"f5c17701-c7d6-4fe4-b8b9-{i:012d}"
+        kind = i % 5
+        if kind == 0:
+            userinfo = base64.b64encode(f"aes-256-gcm:pw{i}".encode()).decode().rstrip('=')
+            lines.append(f"ss://{userinfo}@{server}:{port}#SS-{i}")
+        elif kind == 1:
+            config = {'v': '2', 'ps': f"VMess-{i}", 'add': server, 'port': str(port), 'id': uuid,
+                      'aid': '0', 'scy': 'auto', 'net': 'ws', 'path': rng.choice(paths),
+                      'host': rng.choice(hosts), 'tls': 'tls'}
+            lines.append("vmess://" + base64.b64encode(json.dumps(config).encode()).decode())
+        elif kind == 2:
+            lines.append(f"trojan://pw{i}@{server}:{port}#Trojan-{i}")
+        elif kind == 3:
+            host = rng.choice(hosts)
+            lines.append(f"vless://{uuid}@{server}:{port}?encryption=none&security=tls&sni={host}"
+                         f"&fp=chrome&type=ws&host={host}&path={rng.choice(paths)}#VLESS-{i}")
+        else:
+            lines.append(f"hysteria2://pw{i}@{server}:{port}?sni={rng.choice(hosts)}&insecure=1"
+                         f"&obfs=salamander:secret#Hy2-{i}")
+    return lines
+
+def bench(label, func, lines, repeat):
+    """返回最快一次的吞吐量（行/秒）"""
+    best = None
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = func(lines)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label:<28} {len(lines) / best:>12,.0f} 行/秒  ({count} 个节点, {best * 1000:.1f}ms)")
+    return len(lines) / best
+
+def main():
+    parser = argparse.ArgumentParser(description='代理链接解析性能测试')
+    parser.add_argument('--lines', type=int, default=100000, help='合成链接数量')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数（取最快一次）')
+    args = parser.parse_args()
+    
+    lines = make_corpus(args.lines)
+    print(f"合成订阅: {len(lines)} 行")
+    legacy = bench('旧版 if/elif（逐条）',
+                   lambda ls: len([n for n in map(legacy_parser.parse_proxy_url, ls) if n]), lines, args.repeat)
+    bench('parse_proxy_url（逐条）', lambda ls: len([n for n in map(parse_proxy_url, ls) if n]), lines, args.repeat)
+    batch = bench('parse_proxy_urls（批量）', lambda ls: len(parse_proxy_urls(ls)), lines, args.repeat)
+    print(f"  批量解析相对旧版: {batch / legacy:.2f}x")
+    
+    old_nodes = [n for n in map(legacy_parser.parse_proxy_url, lines) if n]
+    print(f"  解析结果与旧版{'一致' if old_nodes == parse_proxy_urls(lines) else '不一致！'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+节点测速性能测试
+
+在本机为每个节点启动一个正常监听端口（代表可用节点）或"黑洞"端口（积压队列已满、
+连接会一直挂起直到超时，代表不可用节点），比较旧的50线程线程池测速方式
+（基线实现原样内联在本文件中）与事件循环测速器的总耗时。每个节点使用不同的回环地址
+（127.x.y.1，各在不同的 /24 网段），避免端点去重和按IP/网段限流把节点合并到同一个
+地址上。
+
+事件循环测速器对每个端点最多测 PROBE_SAMPLES 次取中位数，单次连接截止时间由延迟
+阈值决定；不可用节点需要过半样本失败才判定，因此超时节点占比高时可能比旧实现慢。
+
+用法: python benchmarks/bench_probe.py [--alive 900] [--dead 100] [--timeout 1]
+"""
+import argparse
+import os
+import resource
+import selectors
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test_nodes
+
+def loopback_address(index):
+    """第index个本机回环地址，每个地址位于不同的 /24 网段（127.0.0.0/8 在Linux上都指向本机）"""
+    return f"127.{1 + index // 256 % 254}.{index % 256}.1"
+
+def start_alive_listeners(addresses):
+    """在每个地址上监听，接受连接后立即关闭；所有监听端口共用一个accept线程"""
+    selector = selectors.DefaultSelector()
+    servers = []
+    for address in addresses:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((address, 0))
+        server.listen(1024)
+        server.setblocking(False)
+        selector.register(server, selectors.EVENT_READ)
+        servers.append(server)
+    
+    def accept_loop():
+        while True:
+            for key, _ in selector.select():
+                try:
+                    conn, _ = key.fileobj.accept()
+                except OSError:
+                    continue
+                conn.close()
+    
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return servers
+
+def start_blackhole_listener(address):
+    """积压队列被占满的监听端口，新的连接请求会被丢弃直到超时"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind((address, 0))
+    server.listen(0)
+    fillers = []
+    for _ in range(4):
+        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client.setblocking(False)
+        try:
+            client.connect(server.getsockname())
+        except BlockingIOError:
+            pass
+        fillers.append(client)
+    return server, fillers
+
+def raise_file_limit(needed):
+    """每个节点占用独立的监听端口，需要提高打开文件数上限"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+def make_nodes(alive, dead):
+    """
+    每个节点使用独立的回环地址和端口
+    
+    测速按 (地址, 端口) 去重，并限制同一IP、同一网段的并发数，
+    节点共用地址时会合并成少数几个端点，测不出真实的并发能力。
+    """
+    raise_file_limit((alive + dead * 5) * 2 + 1024)
+    alive_servers = start_alive_listeners([loopback_address(i) for i in range(alive)])
+    blackholes = [start_blackhole_listener(loopback_address(alive + i)) for i in range(dead)]
+    time.sleep(0.2)
+    nodes = []
+    for i, server in enumerate(alive_servers):
+        address, port = server.getsockname()
+        nodes.append({'name': f"alive-{i}", 'type': 'trojan', 'server': address, 'port': port})
+    for i, (server, _) in enumerate(blackholes):
+        address, port = server.getsockname()
+        nodes.append({'name': f"dead-{i}", 'type': 'trojan', 'server': address, 'port': port})
+    return nodes, (alive_servers, blackholes)
+
+def legacy_latency(node, timeout):
+    """旧实现的单节点测速（基线提交中的test_node_latency_sync，原样保留）"""
+    server = node.get('server', '')
+    port = node.get('port', 0)
+    
+    if not server or not port:
+        return None, None
+    
+    try:
+        start_time = time.time()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        
+        result = sock.connect_ex((server, port))
+        latency = (time.time() - start_time) * 1000  # 转换为毫秒
+        
+        sock.close()
+        
+        if result == 0:  # 连接成功
+            return node, round(latency, 2)
+        else:
+            return node, None
+            
+    except socket.timeout:
+        return node, None
+    except Exception as e:
+        return node, None
+
+def legacy_probe(nodes, timeout, max_latency, workers=50):
+    """旧实现：50线程的线程池中执行阻塞的connect_ex，每个节点测一次，等满超时"""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda node: legacy_latency(node, timeout), nodes))
+    return sum(1 for _, latency in results if latency is not None and latency <= max_latency)
+
+def async_probe(nodes, timeout, max_latency):
+    loop = test_nodes.new_event_loop()
+    try:
+        results = loop.run_until_complete(
+            test_nodes.test_nodes_async([dict(node) for node in nodes], max_latency, timeout)
+        )
+    finally:
+        loop.close()
+    return len(results)
+
+def main():
+    parser = argparse.ArgumentParser(description='节点测速性能测试')
+    parser.add_argument('--alive', type=int, default=900, help='可用节点数')
+    parser.add_argument('--dead', type=int, default=100, help='不可用（超时）节点数')
+    parser.add_argument('--timeout', type=float, default=1.0, help='连接超时（秒）')
+    parser.add_argument('--max-latency', type=float, default=500, help='延迟阈值（毫秒）')
+    parser.add_argument('--skip-legacy', action='store_true', help='不运行旧的线程池实现')
+    args = parser.parse_args()
+    
+    nodes, _servers = make_nodes(args.alive, args.dead)
+    print(f"节点: {args.alive} 个可用 + {args.dead} 个超时，超时 {args.timeout}s")
+    
+    timings = []
+    if not args.skip_legacy:
+        start = time.perf_counter()
+        passed = legacy_probe(nodes, args.timeout, args.max_latency)
+        timings.append(('线程池（50线程）', time.perf_counter() - start, passed))
+    
+    devnull = open(os.devnull, 'w')
+    stdout = sys.stdout
+    sys.stdout = devnull
+    try:
+        start = time.perf_counter()
+        passed = async_probe(nodes, args.timeout, args.max_latency)
+        timings.append(('事件循环测速器', time.perf_counter() - start, passed))
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+    
+    for label, elapsed, passed in timings:
+        print(f"  {label:<16} {elapsed:>7.2f}s  通过 {passed}")
+
+if __name__ == "__main__":
+    main()
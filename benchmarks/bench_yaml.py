@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Clash配置输出性能测试
+
+在不同节点数量下比较原来的整体 yaml.dump（纯Python输出器）与
+save_clash_config（libyaml输出器、逐项写入）的耗时和峰值内存（tracemalloc），
+并检查两者输出逐字节相同。
+
+用法: python benchmarks/bench_yaml.py [--sizes 1000 10000 50000]
+"""
+import argparse
+import filecmp
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yaml
+from generate_clash import generate_clash_config, save_clash_config
+
+FLAGS = ['🇺🇸', '🇯🇵', '🇸🇬', '🇭🇰', '🇩🇪', '🇬🇧', '🇰🇷', '🇹🇼']
+
+def make_nodes(count, seed=1):
+    """生成合成节点（各协议混合，名称带国旗和中文）"""
+    rng = random.Random(seed)
+    nodes = []
+    for i in range(count):
+        server = f"172.66.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+        port = rng.choice([443, 2053, 2083, 8443])
+        name = f"{rng.choice(FLAGS)} 节点-{i}"
+        kind = i % 4
+        if kind == 0:
+            node = {'name': name, 'type': 'ss', 'server': server, 'port': port,
+                    'cipher': 'aes-256-gcm', 'password': f"pw{i}"}
+        elif kind == 1:
+            node = {'name': name, 'type': 'vmess', 'server': server, 'port': port,
+                    'uuid': f"f5c17701-c7d6-4fe4-b8b9-{i:012d}", 'cipher': 'auto', 'network': 'ws',
+                    'ws-opts': {'path': '/ws', 'headers': {'Host': 'example.workers.dev'}},
+                    'tls': True, 'servername': 'example.workers.dev'}
+        elif kind == 2:
+            node = {'name': name, 'type': 'trojan', 'server': server, 'port': port, 'password': f"pw{i}"}
+        else:
+            node = {'name': name, 'type': 'vless', 'server': server, 'port': port,
+                    'uuid': f"f5c17701-c7d6-4fe4-b8b9-{i:012d}", 'tls': True, 'network': 'ws',
+                    'servername': 'bfree.pages.dev', 'ws-opts': {'path': '/?ed=2560'}}
+        node['latency'] = round(rng.uniform(20, 500), 2)
+        nodes.append(node)
+    return nodes
+
+def legacy_save(config, filename):
+    """原来的实现：纯Python输出器整体输出"""
+    with open(filename, 'w', encoding='utf-8') as f:
+        yaml.dump(config, f, allow_unicode=True, default_flow_style=False, sort_keys=False)
+
+def quiet_save(config, filename):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        save_clash_config(config, filename)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+def measure(func, config, filename):
+    """返回 (耗时秒, 峰值内存MB)；计时与内存分开测量，避免tracemalloc影响耗时"""
+    start = time.perf_counter()
+    func(config, filename)
+    elapsed = time.perf_counter() - start
+    
+    tracemalloc.start()
+    func(config, filename)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    args = parser.parse_args()
+    
+    print(f"libyaml: {'可用' if yaml.__with_libyaml__ else '不可用'}")
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_file = os.path.join(tmp, 'legacy.yaml')
+        new_file = os.path.join(tmp, 'new.yaml')
+        for size in args.sizes:
+            stdout = sys.stdout
+            sys.stdout = open(os.devnull, 'w')
+            try:
+                config = generate_clash_config(make_nodes(size))
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            
+            legacy_time, legacy_peak = measure(legacy_save, config, legacy_file)
+            new_time, new_peak = measure(quiet_save, config, new_file)
+            identical = filecmp.cmp(legacy_file, new_file, shallow=False)
+            size_mb = os.path.getsize(new_file) / 1024 / 1024
+            
+            print(f"\n{size} 个节点（输出 {size_mb:.1f}MB，{'逐字节相同' if identical else '输出不一致！'}）")
+            print(f"  {'yaml.dump 整体输出':<24} {legacy_time:7.2f}s  峰值内存 {legacy_peak:7.1f}MB")
+            print(f"  {'save_clash_config':<24} {new_time:7.2f}s  峰值内存 {new_peak:7.1f}MB"
+                  f"  （{legacy_time / new_time:.1f}x）")
+
+if __name__ == '__main__':
+    main()
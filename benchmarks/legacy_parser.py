@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+旧版代理链接解析（基线提交中fetch_subscriptions.py的if/elif实现，原样保留）
+
+仅供 bench_parse.py 作为性能对照，不要在程序中使用。
+"""
+import base64
+import json
+
+def decode_base64(content):
+    """解码Base64内容"""
+    try:
+        decoded = base64.b64decode(content)
+        return decoded.decode('utf-8')
+    except:
+        return None
+
+def parse_proxy_url(proxy_url):
+    """解析代理URL（ss://, vmess://, trojan://, vless://等）"""
+    node = {}
+    
+    if proxy_url.startswith('vless://'):
+        # VLESS格式: vless://uuid@server:port?params#name
+        try:
+            parts = proxy_url[8:].split('#')
+            name = parts[1] if len(parts) > 1 else ''
+            
+            main_part = parts[0].split('?')
+            if len(main_part) >= 1:
+                server_part = main_part[0].split('@')
+                if len(server_part) == 2:
+                    uuid = server_part[0]
+                    server_port = server_part[1].split(':')
+                    if len(server_port) == 2:
+                        node = {
+                            'name': name or f"VLESS-{server_port[0]}:{server_port[1]}",
+                            'type': 'vless',
+                            'server': server_port[0],
+                            'port': int(server_port[1]),
+                            'uuid': uuid,
+                            'tls': False
+                        }
+                        # 解析参数
+                        if len(main_part) > 1:
+                            params = main_part[1].split('&')
+                            for param in params:
+                                if '=' in param:
+                                    key, value = param.split('=', 1)
+                                    from urllib.parse import unquote
+                                    value = unquote(value)
+                                    
+                                    if key == 'type':
+                                        node['network'] = value
+                                    elif key == 'security':
+                                        if value == 'tls' or value == 'reality':
+                                            node['tls'] = True
+                                            if value == 'reality':
+                                                node['type'] = 'vless'  # Reality是VLESS的变体
+                                    elif key == 'sni':
+                                        node['servername'] = value
+                                    elif key == 'host':
+                                        if 'ws-opts' not in node:
+                                            node['ws-opts'] = {}
+                                        if 'headers' not in node['ws-opts']:
+                                            node['ws-opts']['headers'] = {}
+                                        node['ws-opts']['headers']['Host'] = value
+                                    elif key == 'path':
+                                        if 'ws-opts' not in node:
+                                            node['ws-opts'] = {}
+                                        node['ws-opts']['path'] = value
+                                    # Reality 参数
+                                    elif key == 'pbk' or key == 'public-key':
+                                        if 'reality-opts' not in node:
+                                            node['reality-opts'] = {}
+                                        node['reality-opts']['public-key'] = value
+                                    elif key == 'sid' or key == 'short-id':
+                                        if 'reality-opts' not in node:
+                                            node['reality-opts'] = {}
+                                        node['reality-opts']['short-id'] = value
+                                    elif key == 'fp' or key == 'client-fingerprint':
+                                        node['client-fingerprint'] = value
+        except Exception as e:
+            pass
+    
+    elif proxy_url.startswith('ss://'):
+        # SS格式: ss://base64(method:password)@server:port#name
+        try:
+            parts = proxy_url[5:].split('#')
+            name = parts[1] if len(parts) > 1 else ''
+            
+            main_part = parts[0].split('@')
+            if len(main_part) == 2:
+                server_port = main_part[1].split(':')
+                if len(server_port) == 2:
+                    decoded = decode_base64(main_part[0] + '==')
+                    if decoded:
+                        method_password = decoded.split(':')
+                        if len(method_password) == 2:
+                            node = {
+                                'name': name or f"SS-{server_port[0]}:{server_port[1]}",
+                                'type': 'ss',
+                                'server': server_port[0],
+                                'port': int(server_port[1]),
+                                'cipher': method_password[0],
+                                'password': method_password[1]
+                            }
+        except:
+            pass
+    
+    elif proxy_url.startswith('vmess://'):
+        # VMess格式: vmess://base64(json)
+        try:
+            decoded = decode_base64(proxy_url[8:])
+            if decoded:
+                vmess_config = json.loads(decoded)
+                node = {
+                    'name': vmess_config.get('ps', vmess_config.get('add', 'VMess')),
+                    'type': 'vmess',
+                    'server': vmess_config.get('add', ''),
+                    'port': int(vmess_config.get('port', 0)),
+                    'uuid': vmess_config.get('id', ''),
+                    'cipher': vmess_config.get('scy', 'auto'),
+                    'network': vmess_config.get('net', 'tcp')
+                }
+                
+                # alterId字段（旧版VMess需要）
+                aid = vmess_config.get('aid', 0)
+                if aid:
+                    node['alterId'] = int(aid)
+                
+                # WebSocket配置
+                if vmess_config.get('net') == 'ws':
+                    ws_opts = {
+                        'path': vmess_config.get('path', '/')
+                    }
+                    host = vmess_config.get('host', '')
+                    if host:
+                        ws_opts['headers'] = {'Host': host}
+                    node['ws-opts'] = ws_opts
+                
+                # TLS配置
+                if vmess_config.get('tls') in ['tls', '1']:
+                    node['tls'] = True
+                    sni = vmess_config.get('sni') or vmess_config.get('host', '')
+                    if sni:
+                        node['servername'] = sni
+                
+                # skip-cert-verify (如果需要)
+                if vmess_config.get('skip-cert-verify'):
+                    node['skip-cert-verify'] = True
+        except Exception as e:
+            pass
+    
+    elif proxy_url.startswith('trojan://'):
+        # Trojan格式: trojan://password@server:port#name
+        try:
+            parts = proxy_url[9:].split('#')
+            name = parts[1] if len(parts) > 1 else ''
+            
+            main_part = parts[0].split('@')
+            if len(main_part) == 2:
+                server_port = main_part[1].split(':')
+                if len(server_port) == 2:
+                    password = main_part[0]
+                    node = {
+                        'name': name or f"Trojan-{server_port[0]}:{server_port[1]}",
+                        'type': 'trojan',
+                        'server': server_port[0],
+                        'port': int(server_port[1]),
+                        'password': password
+                    }
+        except:
+            pass
+    
+    elif proxy_url.startswith('hysteria2://') or proxy_url.startswith('hysteria://'):
+        # Hysteria2格式: hysteria2://password@server:port?params#name
+        # 也支持旧版hysteria://
+        try:
+            protocol_prefix = 'hysteria2://' if proxy_url.startswith('hysteria2://') else 'hysteria://'
+            parts = proxy_url[len(protocol_prefix):].split('#')
+            name = parts[1] if len(parts) > 1 else ''
+            
+            main_part = parts[0].split('?')
+            if len(main_part) >= 1:
+                server_part = main_part[0].split('@')
+                if len(server_part) == 2:
+                    password = server_part[0]
+                    server_port = server_part[1].split(':')
+                    if len(server_port) == 2:
+                        node = {
+                            'name': name or f"Hysteria2-{server_port[0]}:{server_port[1]}",
+                            'type': 'hysteria2',
+                            'server': server_port[0],
+                            'port': int(server_port[1]),
+                            'password': password
+                        }
+                        
+                        # 解析参数
+                        if len(main_part) > 1:
+                            params = main_part[1].split('&')
+                            for param in params:
+                                if '=' in param:
+                                    key, value = param.split('=', 1)
+                                    from urllib.parse import unquote
+                                    value = unquote(value)
+                                    
+                                    if key == 'sni' or key == 'peer':
+                                        node['sni'] = value
+                                    elif key == 'insecure':
+                                        if value.lower() in ['true', '1', 'yes']:
+                                            node['skip-cert-verify'] = True
+                                    elif key == 'obfs':
+                                        if 'obfs' not in node:
+                                            node['obfs'] = {}
+                                        if value.startswith('salamander'):
+                                            # salamander:password
+                                            obfs_parts = value.split(':')
+                                            if len(obfs_parts) == 2:
+                                                node['obfs']['type'] = 'salamander'
+                                                node['obfs']['password'] = obfs_parts[1]
+                                    elif key == 'obfs-password':
+                                        if 'obfs' not in node:
+                                            node['obfs'] = {}
+                                        if 'type' not in node['obfs']:
+                                            node['obfs']['type'] = 'salamander'
+                                        node['obfs']['password'] = value
+                                    elif key == 'bandwidth' or key == 'up' or key == 'down':
+                                        # Hysteria2 带宽设置
+                                        if 'bandwidth' not in node:
+                                            node['bandwidth'] = {}
+                                        if key == 'up':
+                                            node['bandwidth']['up'] = value
+                                        elif key == 'down':
+                                            node['bandwidth']['down'] = value
+        except Exception as e:
+            pass
+    
+    return node if node.get('server') else None
+
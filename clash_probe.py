@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Clash/mihomo 外部控制器测速后端
+
+把候选节点通过 external-controller 的 REST API 加载到本地运行的Clash内核
+（PUT /configs），再并发调用 GET /proxies/{name}/delay 让内核通过节点实际
+请求测速地址，得到端到端延迟，无需自己实现各种代理协议。
+
+注意：加载配置会替换内核当前的运行配置，应使用专门用于测速的内核实例。
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+import requests
+from requests.adapters import HTTPAdapter
+import yaml
+from config import (
+    CLASH_API_URL, CLASH_API_SECRET, CLASH_PROBE_URL, CLASH_PROBE_TIMEOUT, CLASH_PROBE_CONCURRENCY
+)
+
+class ClashApiError(Exception):
+    """控制器不可用或加载配置失败"""
+
+class ClashController:
+    """Clash external-controller REST API客户端"""
+    
+    def __init__(self, base_url=CLASH_API_URL, secret=None, concurrency=CLASH_PROBE_CONCURRENCY):
+        self.base_url = base_url.rstrip('/')
+        secret = secret if secret is not None else os.environ.get('CLASH_API_SECRET', CLASH_API_SECRET)
+        self.session = requests.Session()
+        # 本地控制器不走环境变量中的代理
+        self.session.trust_env = False
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if secret:
+            self.session.headers['Authorization'] = f"Bearer {secret}"
+    
+    def version(self):
+        try:
+            response = self.session.get(f"{self.base_url}/version", timeout=5)
+        except requests.RequestException as e:
+            raise ClashApiError(f"无法连接控制器 {self.base_url}: {str(e)[:100]}")
+        if response.status_code == 401:
+            raise ClashApiError("控制器拒绝访问（secret不正确）")
+        if response.status_code != 200:
+            raise ClashApiError(f"控制器返回 HTTP {response.status_code}")
+        try:
+            data = response.json()
+        except ValueError:
+            raise ClashApiError(f"控制器返回的不是JSON: {response.text[:100]}")
+        if not isinstance(data, dict):
+            raise ClashApiError(f"控制器返回的版本信息格式不正确: {response.text[:100]}")
+        return data.get('version', '')
+    
+    def load_proxies(self, proxies):
+        """用只包含这些代理的最小配置替换内核运行配置"""
+        payload = yaml.safe_dump({
+            'mode': 'global',
+            'proxies': proxies,
+            'rules': ['MATCH,DIRECT'],
+        }, allow_unicode=True, sort_keys=False)
+        try:
+            response = self.session.put(
+                f"{self.base_url}/configs", params={'force': 'true'},
+                json={'path': '', 'payload': payload}, timeout=30
+            )
+        except requests.RequestException as e:
+            raise ClashApiError(f"加载测速配置失败: {str(e)[:100]}")
+        if response.status_code not in (200, 204):
+            raise ClashApiError(f"加载测速配置失败: HTTP {response.status_code} {response.text[:100]}")
+    
+    def delay(self, name, url=CLASH_PROBE_URL, timeout=CLASH_PROBE_TIMEOUT):
+        """通过代理请求url的延迟（毫秒），超时或失败返回None"""
+        try:
+            response = self.session.get(
+                f"{self.base_url}/proxies/{quote(name, safe='')}/delay",
+                params={'url': url, 'timeout': timeout},
+                timeout=timeout / 1000 + 5
+            )
+        except requests.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+        try:
+            data = response.json()
+        except ValueError:
+            return None
+        delay = data.get('delay') if isinstance(data, dict) else None
+        return delay if isinstance(delay, (int, float)) and delay > 0 else None
+    
+    def close(self):
+        self.session.close()
+
+def probe_nodes(nodes, controller=None, concurrency=CLASH_PROBE_CONCURRENCY,
+                url=CLASH_PROBE_URL, timeout=CLASH_PROBE_TIMEOUT):
+    """
+    通过Clash内核测速，返回与nodes顺序一致的延迟列表（毫秒，失败为None）
+    
+    控制器不可用时抛出ClashApiError。加载时使用 probe-序号 作为代理名，
+    避免原名称中的特殊字符或重名影响API调用。
+    """
+    own = controller is None
+    controller = controller or ClashController(concurrency=concurrency)
+    try:
+        version = controller.version()
+        print(f"  Clash控制器 {controller.base_url}（{version or '未知版本'}）")
+        names = [f"probe-{i}" for i in range(len(nodes))]
+        controller.load_proxies([
+            dict({key: value for key, value in node.items() if not key.startswith('_') and key != 'latency'}, name=name)
+            for name, node in zip(names, nodes)
+        ])
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(lambda name: controller.delay(name, url, timeout), names))
+    finally:
+        if own:
+            controller.close()
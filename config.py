@@ -7,9 +7,79 @@ SUBSCRIPTION_URLS = [
     "http://103.99.52.140:2096/sub/india"
 ]
 
+# 获取配置
+FETCH_TIMEOUT = 30  # 单个订阅请求超时时间（秒），也是自适应超时的上限
+FETCH_MIN_TIMEOUT = 10  # 自适应超时的下限（秒）
+FETCH_TIMEOUT_FACTOR = 3  # 自适应超时 = 历史P90响应时间 × 此倍数 + FETCH_MIN_TIMEOUT / 2
+SOURCE_HISTORY_SIZE = 20  # 每个订阅源保留的最近请求记录数
+CIRCUIT_FAILURE_THRESHOLD = 3  # 连续失败多少次后熔断该订阅源
+CIRCUIT_MIN_SUCCESS_RATE = 0.3  # 最近成功率低于此值时也熔断（时好时坏的订阅源）
+CIRCUIT_MIN_SAMPLES = 5  # 按成功率熔断所需的最少请求记录数
+CIRCUIT_COOLDOWN = 6 * 3600  # 熔断后首次半开重试的等待时间（秒），再次失败时翻倍
+CIRCUIT_MAX_COOLDOWN = 7 * 24 * 3600  # 熔断等待时间上限（秒）
+HEDGE_ENABLED = True  # 主请求迟迟未返回时是否并行发起备用路径（普通请求/cloudscraper）
+HEDGE_PERCENTILE = 0.9  # 对冲延迟取该订阅源历史响应时间的分位数
+HEDGE_MIN_DELAY = 1.0  # 对冲延迟下限（秒）
+HEDGE_DEFAULT_DELAY = 3.0  # 没有历史记录时的对冲延迟（秒）
+FETCH_MAX_WORKERS = 16  # 并发获取订阅的最大线程数
+FETCH_PER_HOST_LIMIT = 2  # 同一主机的最大并发请求数
+HTTP_POOL_MAXSIZE = 8  # 每个主机保持的最大keep-alive连接数
+SCRAPER_ROUTE_TTL = 7 * 24 * 3600  # 记住"需要cloudscraper"的主机多长时间（秒）
+STREAM_THRESHOLD_BYTES = 1024 * 1024  # 超过此大小的Base64/纯文本订阅使用流式解码
+STREAM_CHUNK_SIZE = 64 * 1024  # 流式读取的块大小（字节）
+PARALLEL_PARSE_MIN_LINES = 20000  # 单个订阅超过此行数时使用多进程并行解析
+PARALLEL_PARSE_CHUNK_SIZE = 5000  # 并行解析时每个任务的行数
+PARALLEL_PARSE_WORKERS = None  # 并行解析进程数（None为CPU核数，1为禁用并行解析）
+
+# 缓存配置
+CACHE_DIR = '.cache'  # 本地缓存目录（订阅缓存、解析结果等）
+SUBSCRIPTION_CACHE_ENABLED = True  # 是否启用订阅缓存（条件请求 + 解析结果缓存）
+STALE_IF_ERROR = True  # 订阅获取失败时是否使用上次成功的节点列表
+STALE_MAX_AGE = 24 * 3600  # 过期节点列表的最长可用时间（秒）
+STATE_RETENTION = 7 * 24 * 3600  # 节点状态记录保留时间（秒），超过此时间未出现的节点将被删除
+
 # 测速配置
 MAX_LATENCY = 500  # 最大延迟（毫秒），超过此值的节点将被过滤
 TEST_TIMEOUT = 5  # 测速超时时间（秒）
+PROBE_CONCURRENCY = 500  # 同时进行的测速连接数上限（会根据文件描述符上限自动下调）
+PROBE_USE_UVLOOP = True  # 已安装uvloop时使用uvloop事件循环
+PROBE_BACKEND = 'tcp'  # 测速后端: 'tcp' 只做连接测速；'clash' 再通过本地Clash内核做端到端测速
+CLASH_API_URL = 'http://127.0.0.1:9090'  # 用于测速的Clash/mihomo内核的external-controller地址（会替换其运行配置）
+CLASH_API_SECRET = ''  # 控制器secret，也可通过环境变量 CLASH_API_SECRET 设置
+CLASH_PROBE_URL = 'https://www.gstatic.com/generate_204'  # Clash内核测速请求的地址
+CLASH_PROBE_TIMEOUT = 5000  # Clash内核单个节点测速超时（毫秒）
+CLASH_PROBE_CONCURRENCY = 16  # 同时进行的Clash测速请求数
+CLASH_PROBE_TOP = 0  # 只把TCP排名前多少个节点交给Clash测速（其余节点不保留），0表示全部
+HAPPY_EYEBALLS_DELAY = 0.25  # 双栈域名竞速测速时，启动下一个地址前等待的时间（秒，RFC 8305）
+HAPPY_EYEBALLS_MAX_ADDRESSES = 4  # 每个域名最多参与竞速的地址数（IPv4/IPv6交替）
+PROBE_PER_IP_LIMIT = 4  # 同一目标IP同时进行的测速数量上限
+PROBE_PER_SUBNET_LIMIT = 16  # 同一 /24（IPv6为 /64）网段同时进行的测速数量上限
+PROBE_INITIAL_CONCURRENCY = 64  # 初始并发窗口，之后按AIMD在 [最小值, PROBE_CONCURRENCY] 间调整
+PROBE_MIN_CONCURRENCY = 16  # 并发窗口最小值
+PROBE_AIMD_DECREASE = 0.5  # 出现拥塞信号时并发窗口的缩小比例
+PROBE_INFLATION_RATIO = 2.0  # 连接时间超过参考延迟的多少倍视为拥塞
+PROBE_INFLATION_MIN = 30  # 且至少超出参考延迟多少毫秒才视为拥塞
+PROBE_DEADLINE_MARGIN = 0.2  # 单次连接的截止时间 = MAX_LATENCY × (1 + 此比例)，且不超过TEST_TIMEOUT
+PROBE_STOP_AFTER = 0  # 确认此数量的可用节点后取消剩余测速（0为不启用）
+PROBE_SAMPLES = 3  # 每个端点最多测速次数，取中位数
+PROBE_CLEAR_MARGIN = 0.5  # 已有过半样本低于 MAX_LATENCY × 此比例时提前结束采样
+PROBE_JITTER_WEIGHT = 1.0  # 排序评分中抖动的权重
+PROBE_LOSS_PENALTY = 1000  # 排序评分中丢包率的惩罚（毫秒 × 丢包率）
+HISTORY_EWMA_ALPHA = 0.3  # 历史延迟EWMA中本次结果的权重
+HISTORY_WEIGHT = 0.3  # 排序时历史EWMA延迟与本次评分的混合比例
+BACKOFF_MIN_FAILURES = 2  # 连续失败多少次后开始退避（暂停测速）
+BACKOFF_BASE = 3 * 3600  # 首次退避时间（秒，约一次运行间隔），之后每次失败翻倍
+BACKOFF_MAX = 2 * 24 * 3600  # 最长退避时间（秒）
+L7_PROBE_ENABLED = False  # 是否在TCP测速后通过节点实际请求HTTP地址（协议层测速）
+L7_PROBE_TOP = 50  # 只对TCP测速排名前多少个节点做协议层测速
+L7_PROBE_URL = 'http://www.gstatic.com/generate_204'  # 协议层测速请求的地址（仅支持http://）
+L7_PROBE_TIMEOUT = 5  # 协议层测速超时时间（秒）
+L7_PROBE_CONCURRENCY = 20  # 协议层测速并发数
+DNS_CONCURRENCY = 64  # 测速前并发解析域名的数量
+DNS_TIMEOUT = 5  # 单个域名解析超时时间（秒）
+DNS_CACHE_TTL = 1800  # 域名解析结果缓存时间（秒）
+DNS_CACHE_PERSIST = True  # 是否将解析结果保存到缓存目录供下次运行使用
+PROBE_FRESHNESS = 4 * 3600  # 未变化节点的测速结果在此时间内直接复用（秒），每3小时运行时约隔一次重测
 
 # 分流规则配置
 RULES = {
@@ -90,6 +160,13 @@ RULES = {
     ]
 }
 
+# 输出方式
+OUTPUT_MODE = 'inline'  # 'inline' 节点和规则全部写入主配置；'provider' 写成独立的proxy-provider/rule-provider文件
+PROVIDER_DIR = 'providers'  # provider文件目录（规则列表在其下的rules目录）
+PROVIDER_BASE_URL = 'https://raw.githubusercontent.com/soulbar/cursor/main'  # 客户端下载provider文件的地址前缀
+PROXY_PROVIDER_INTERVAL = 3 * 3600  # 客户端更新节点provider的间隔（秒）
+RULE_PROVIDER_INTERVAL = 24 * 3600  # 客户端更新规则provider的间隔（秒）
+
 # Clash配置模板
 CLASH_CONFIG_TEMPLATE = {
     "port": 7890,
@@ -4,14 +4,35 @@
 订阅链接获取和解析模块
 """
 import base64
+import codecs
+import hashlib
+import itertools
+import multiprocessing
+import os
 import re
-import requests
+import tempfile
 import yaml
 import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from urllib.parse import urlparse
-import cloudscraper
 import urllib3
 import ssl
+import http_sessions
+from proxy_parser import decode_base64, parse_proxy_urls, parse_proxy_chunk, PROXY_SCHEMES
+import source_health
+import subscription_cache
+from node_state import node_identity, node_fingerprint
+from naming import sanitize_node_name, assign_names
+from config import (
+    FETCH_MAX_WORKERS, FETCH_PER_HOST_LIMIT,
+    SUBSCRIPTION_CACHE_ENABLED, STALE_IF_ERROR, STALE_MAX_AGE,
+    STREAM_THRESHOLD_BYTES, STREAM_CHUNK_SIZE,
+    PARALLEL_PARSE_MIN_LINES, PARALLEL_PARSE_CHUNK_SIZE, PARALLEL_PARSE_WORKERS,
+    HEDGE_ENABLED
+)
 
 # 禁用SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -21,403 +42,510 @@ ssl_context = ssl.create_default_context()
 ssl_context.check_hostname = False
 ssl_context.verify_mode = ssl.CERT_NONE
 
-def decode_base64(content):
-    """解码Base64内容"""
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+def _get_plain(url, headers, timeout):
+    """通过共享会话发起普通请求"""
+    response = http_sessions.get_pool().session().get(
+        url, 
+        headers=headers, 
+        timeout=timeout, 
+        allow_redirects=True,
+        stream=True
+    )
+    response.raise_for_status()
+    return response
+
+def _get_scraper(url, headers, timeout):
+    """通过该主机复用的cloudscraper客户端发起请求"""
+    host = urlparse(url).netloc.lower()
+    response = http_sessions.get_pool().scraper(host).get(
+        url, 
+        headers=headers, 
+        timeout=timeout, 
+        allow_redirects=True,
+        stream=True
+    )
+    response.raise_for_status()
+    return response
+
+# 下载尝试在独立线程池中运行，以便主请求与对冲请求同时进行
+_download_executor = ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS * 2, thread_name_prefix='download')
+
+def _discard_response(future):
+    """关闭落败请求的响应，释放连接（requests无法中途取消，只能在返回后关闭）"""
     try:
-        decoded = base64.b64decode(content)
-        return decoded.decode('utf-8')
-    except:
-        return None
+        future.result().close()
+    except Exception:
+        pass
 
-def parse_proxy_url(proxy_url):
-    """解析代理URL（ss://, vmess://, trojan://, vless://等）"""
-    node = {}
+def _download(url, headers, timeout, hedge_delay=None, timing=None):
+    """下载订阅内容，失败时返回None
     
-    if proxy_url.startswith('vless://'):
-        # VLESS格式: vless://uuid@server:port?params#name
-        try:
-            parts = proxy_url[8:].split('#')
-            name = parts[1] if len(parts) > 1 else ''
-            
-            main_part = parts[0].split('?')
-            if len(main_part) >= 1:
-                server_part = main_part[0].split('@')
-                if len(server_part) == 2:
-                    uuid = server_part[0]
-                    server_port = server_part[1].split(':')
-                    if len(server_port) == 2:
-                        node = {
-                            'name': name or f"VLESS-{server_port[0]}:{server_port[1]}",
-                            'type': 'vless',
-                            'server': server_port[0],
-                            'port': int(server_port[1]),
-                            'uuid': uuid,
-                            'tls': False
-                        }
-                        # 解析参数
-                        if len(main_part) > 1:
-                            params = main_part[1].split('&')
-                            for param in params:
-                                if '=' in param:
-                                    key, value = param.split('=', 1)
-                                    from urllib.parse import unquote
-                                    value = unquote(value)
-                                    
-                                    if key == 'type':
-                                        node['network'] = value
-                                    elif key == 'security':
-                                        if value == 'tls' or value == 'reality':
-                                            node['tls'] = True
-                                            if value == 'reality':
-                                                node['type'] = 'vless'  # Reality是VLESS的变体
-                                    elif key == 'sni':
-                                        node['servername'] = value
-                                    elif key == 'host':
-                                        if 'ws-opts' not in node:
-                                            node['ws-opts'] = {}
-                                        if 'headers' not in node['ws-opts']:
-                                            node['ws-opts']['headers'] = {}
-                                        node['ws-opts']['headers']['Host'] = value
-                                    elif key == 'path':
-                                        if 'ws-opts' not in node:
-                                            node['ws-opts'] = {}
-                                        node['ws-opts']['path'] = value
-                                    # Reality 参数
-                                    elif key == 'pbk' or key == 'public-key':
-                                        if 'reality-opts' not in node:
-                                            node['reality-opts'] = {}
-                                        node['reality-opts']['public-key'] = value
-                                    elif key == 'sid' or key == 'short-id':
-                                        if 'reality-opts' not in node:
-                                            node['reality-opts'] = {}
-                                        node['reality-opts']['short-id'] = value
-                                    elif key == 'fp' or key == 'client-fingerprint':
-                                        node['client-fingerprint'] = value
-        except Exception as e:
-            pass
+    先走主路径（默认普通请求，已知需要cloudscraper的主机走cloudscraper），
+    主路径失败时立即改走另一条路径；若设置了hedge_delay且主路径在此时间内
+    仍未返回，则同时发起另一条路径，取先返回的有效响应。
+    传入timing字典时，在其中记录收到响应头的耗时（秒，'response'）。
+    """
+    start_time = time.perf_counter()
+    pool = http_sessions.get_pool()
+    host = urlparse(url).netloc.lower()
     
-    elif proxy_url.startswith('ss://'):
-        # SS格式: ss://base64(method:password)@server:port#name
-        try:
-            parts = proxy_url[5:].split('#')
-            name = parts[1] if len(parts) > 1 else ''
-            
-            main_part = parts[0].split('@')
-            if len(main_part) == 2:
-                server_port = main_part[1].split(':')
-                if len(server_port) == 2:
-                    decoded = decode_base64(main_part[0] + '==')
-                    if decoded:
-                        method_password = decoded.split(':')
-                        if len(method_password) == 2:
-                            node = {
-                                'name': name or f"SS-{server_port[0]}:{server_port[1]}",
-                                'type': 'ss',
-                                'server': server_port[0],
-                                'port': int(server_port[1]),
-                                'cipher': method_password[0],
-                                'password': method_password[1]
-                            }
-        except:
-            pass
-    
-    elif proxy_url.startswith('vmess://'):
-        # VMess格式: vmess://base64(json)
-        try:
-            decoded = decode_base64(proxy_url[8:])
-            if decoded:
-                vmess_config = json.loads(decoded)
-                node = {
-                    'name': vmess_config.get('ps', vmess_config.get('add', 'VMess')),
-                    'type': 'vmess',
-                    'server': vmess_config.get('add', ''),
-                    'port': int(vmess_config.get('port', 0)),
-                    'uuid': vmess_config.get('id', ''),
-                    'cipher': vmess_config.get('scy', 'auto'),
-                    'network': vmess_config.get('net', 'tcp')
-                }
-                
-                # alterId字段（旧版VMess需要）
-                aid = vmess_config.get('aid', 0)
-                if aid:
-                    node['alterId'] = int(aid)
-                
-                # WebSocket配置
-                if vmess_config.get('net') == 'ws':
-                    ws_opts = {
-                        'path': vmess_config.get('path', '/')
-                    }
-                    host = vmess_config.get('host', '')
-                    if host:
-                        ws_opts['headers'] = {'Host': host}
-                    node['ws-opts'] = ws_opts
-                
-                # TLS配置
-                if vmess_config.get('tls') in ['tls', '1']:
-                    node['tls'] = True
-                    sni = vmess_config.get('sni') or vmess_config.get('host', '')
-                    if sni:
-                        node['servername'] = sni
-                
-                # skip-cert-verify (如果需要)
-                if vmess_config.get('skip-cert-verify'):
-                    node['skip-cert-verify'] = True
-        except Exception as e:
-            pass
+    paths = [('plain', _get_plain), ('scraper', _get_scraper)]
+    if pool.needs_scraper(host):
+        paths.reverse()
     
-    elif proxy_url.startswith('trojan://'):
-        # Trojan格式: trojan://password@server:port#name
-        try:
-            parts = proxy_url[9:].split('#')
-            name = parts[1] if len(parts) > 1 else ''
-            
-            main_part = parts[0].split('@')
-            if len(main_part) == 2:
-                server_port = main_part[1].split(':')
-                if len(server_port) == 2:
-                    password = main_part[0]
-                    node = {
-                        'name': name or f"Trojan-{server_port[0]}:{server_port[1]}",
-                        'type': 'trojan',
-                        'server': server_port[0],
-                        'port': int(server_port[1]),
-                        'password': password
-                    }
-        except:
-            pass
-    
-    elif proxy_url.startswith('hysteria2://') or proxy_url.startswith('hysteria://'):
-        # Hysteria2格式: hysteria2://password@server:port?params#name
-        # 也支持旧版hysteria://
-        try:
-            protocol_prefix = 'hysteria2://' if proxy_url.startswith('hysteria2://') else 'hysteria://'
-            parts = proxy_url[len(protocol_prefix):].split('#')
-            name = parts[1] if len(parts) > 1 else ''
-            
-            main_part = parts[0].split('?')
-            if len(main_part) >= 1:
-                server_part = main_part[0].split('@')
-                if len(server_part) == 2:
-                    password = server_part[0]
-                    server_port = server_part[1].split(':')
-                    if len(server_port) == 2:
-                        node = {
-                            'name': name or f"Hysteria2-{server_port[0]}:{server_port[1]}",
-                            'type': 'hysteria2',
-                            'server': server_port[0],
-                            'port': int(server_port[1]),
-                            'password': password
-                        }
-                        
-                        # 解析参数
-                        if len(main_part) > 1:
-                            params = main_part[1].split('&')
-                            for param in params:
-                                if '=' in param:
-                                    key, value = param.split('=', 1)
-                                    from urllib.parse import unquote
-                                    value = unquote(value)
-                                    
-                                    if key == 'sni' or key == 'peer':
-                                        node['sni'] = value
-                                    elif key == 'insecure':
-                                        if value.lower() in ['true', '1', 'yes']:
-                                            node['skip-cert-verify'] = True
-                                    elif key == 'obfs':
-                                        if 'obfs' not in node:
-                                            node['obfs'] = {}
-                                        if value.startswith('salamander'):
-                                            # salamander:password
-                                            obfs_parts = value.split(':')
-                                            if len(obfs_parts) == 2:
-                                                node['obfs']['type'] = 'salamander'
-                                                node['obfs']['password'] = obfs_parts[1]
-                                    elif key == 'obfs-password':
-                                        if 'obfs' not in node:
-                                            node['obfs'] = {}
-                                        if 'type' not in node['obfs']:
-                                            node['obfs']['type'] = 'salamander'
-                                        node['obfs']['password'] = value
-                                    elif key == 'bandwidth' or key == 'up' or key == 'down':
-                                        # Hysteria2 带宽设置
-                                        if 'bandwidth' not in node:
-                                            node['bandwidth'] = {}
-                                        if key == 'up':
-                                            node['bandwidth']['up'] = value
-                                        elif key == 'down':
-                                            node['bandwidth']['down'] = value
-        except Exception as e:
-            pass
+    attempts = {}
+    errors = {}
     
-    return node if node.get('server') else None
+    def launch():
+        name, func = paths[len(attempts)]
+        future = _download_executor.submit(func, url, headers, timeout)
+        attempts[future] = name
+        return future
+    
+    pending = {launch()}
+    winner = None
+    while pending and winner is None:
+        wait_timeout = hedge_delay if len(attempts) < len(paths) else None
+        done, pending = wait(pending, timeout=wait_timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            # 主路径超过对冲延迟仍未返回，并行发起备用路径
+            print(f"  ⏩ {hedge_delay:.1f}秒内未响应，同时尝试{'cloudscraper' if paths[1][0] == 'scraper' else '普通请求'}")
+            pending.add(launch())
+            continue
+        for future in done:
+            try:
+                response = future.result()
+            except Exception as e:
+                errors[attempts[future]] = e
+                continue
+            if winner is None:
+                winner = (attempts[future], response)
+            else:
+                response.close()
+        if winner is None and not pending and len(attempts) < len(paths):
+            # 主路径已失败，立即尝试备用路径
+            pending.add(launch())
+    
+    for future in pending:
+        future.add_done_callback(_discard_response)
+    
+    if winner is None:
+        error = errors.get('scraper') or errors.get('plain')
+        print(f"  ⚠️  请求失败: {str(error)[:100]}")
+        return None
+    
+    if timing is not None:
+        timing['response'] = time.perf_counter() - start_time
+    
+    # 只有另一条路径确实失败时才更新路由记录，单纯较慢不算
+    name, response = winner
+    if name == 'scraper' and 'plain' in errors:
+        pool.mark_scraper(host)
+    elif name == 'plain' and 'scraper' in errors:
+        pool.mark_plain(host)
+    return response
+
+# 优先使用libyaml的C加载器
+_YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
 
-def fetch_subscription(url, timeout=30):
-    """获取订阅链接内容"""
+FORMAT_ORDER = ('json', 'yaml', 'base64', 'plain')
+
+_YAML_KEY_PATTERN = re.compile(r'^[A-Za-z_][\w-]*\s*:(?!//)', re.M)
+_BASE64_PATTERN = re.compile(r'^[A-Za-z0-9+/=_\-\s]+$')
+_PROXIES_KEY_PATTERN = re.compile(r'^proxies\s*:', re.M)
+_TOP_LEVEL_KEY_PATTERN = re.compile(r'^[^\s#\-][^\n]*:', re.M)
+
+def detect_format(content, content_type=''):
+    """根据Content-Type和内容开头一次性判断订阅格式（json/yaml/base64/plain）"""
+    content_type = content_type.lower()
+    head = content[:4096].lstrip('\ufeff \t\r\n')
+    
+    if 'json' in content_type or head.startswith('{'):
+        return 'json'
+    if head.startswith(PROXY_SCHEMES):
+        return 'plain'
+    if 'yaml' in content_type or _YAML_KEY_PATTERN.search(head):
+        return 'yaml'
+    if head and _BASE64_PATTERN.match(head):
+        return 'base64'
+    return 'plain'
+
+def extract_yaml_proxies(content):
+    """只加载YAML中的proxies部分，跳过体积很大的rules/proxy-groups"""
+    match = _PROXIES_KEY_PATTERN.search(content)
+    if not match:
+        return None
+    
+    # proxies之后的下一个顶层键即为该部分的结束位置
+    next_key = _TOP_LEVEL_KEY_PATTERN.search(content, match.end())
+    section = content[match.start():next_key.start() if next_key else len(content)]
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        }
-        
-        # 先尝试普通requests（禁用SSL验证）
-        response = None
-        try:
-            response = requests.get(
-                url, 
-                headers=headers, 
-                timeout=timeout, 
-                allow_redirects=True,
-                verify=False
+        config = yaml.load(section, Loader=_YamlLoader)
+        if isinstance(config, dict) and isinstance(config.get('proxies'), list):
+            return config['proxies']
+    except yaml.YAMLError:
+        pass
+    
+    # 切片失败时退回完整加载
+    config = yaml.load(content, Loader=_YamlLoader)
+    if isinstance(config, dict) and 'proxies' in config:
+        return config['proxies']
+    return None
+
+def _parse_json(content):
+    config = json.loads(content)
+    if isinstance(config, dict) and 'proxies' in config:
+        nodes = config['proxies']
+        print(f"  ✓ 解析为JSON格式，找到 {len(nodes)} 个节点")
+        return nodes
+    return None
+
+def _parse_yaml(content):
+    nodes = extract_yaml_proxies(content)
+    if nodes is not None:
+        print(f"  ✓ 解析为YAML格式，找到 {len(nodes)} 个节点")
+    return nodes
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+def _parse_workers():
+    return PARALLEL_PARSE_WORKERS or os.cpu_count() or 1
+
+def _get_parse_pool():
+    """获取共享的解析进程池，多个大订阅同时解析时不会各自创建进程池"""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # 订阅在线程池中获取，fork多线程进程不安全，因此使用spawn
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=_parse_workers(),
+                mp_context=multiprocessing.get_context('spawn')
             )
-            response.raise_for_status()
-        except Exception as e:
-            # 如果失败，尝试使用cloudscraper
-            try:
-                scraper = cloudscraper.create_scraper(
-                    browser={
-                        'browser': 'chrome',
-                        'platform': 'windows',
-                        'desktop': True
-                    },
-                    verify=False
-                )
-                response = scraper.get(
-                    url, 
-                    headers=headers, 
-                    timeout=timeout, 
-                    allow_redirects=True
-                )
-                response.raise_for_status()
-            except Exception as e2:
-                print(f"  ⚠️  请求失败: {str(e2)[:100]}")
-                return None
-        
-        if not response:
-            return None
-        
-        content = response.text.strip()
-        content_type = response.headers.get('Content-Type', '').lower()
-        
-        # 尝试解析为JSON格式（Clash配置）
-        if 'json' in content_type or content.startswith('{'):
-            try:
-                config = json.loads(content)
-                if isinstance(config, dict) and 'proxies' in config:
-                    nodes = config['proxies']
-                    print(f"  ✓ 解析为JSON格式，找到 {len(nodes)} 个节点")
-                    return nodes
-            except Exception as e:
-                pass
-        
-        # 尝试解析为YAML格式（Clash配置）
+        return _parse_pool
+
+def shutdown_parse_pool():
+    """关闭解析进程池"""
+    global _parse_pool
+    with _parse_pool_lock:
+        pool, _parse_pool = _parse_pool, None
+    if pool is not None:
+        pool.shutdown()
+
+def parse_proxy_lines(lines, min_lines=PARALLEL_PARSE_MIN_LINES, chunk_size=PARALLEL_PARSE_CHUNK_SIZE):
+    """解析代理链接行；行数超过min_lines时切分成块交给进程池并行解析，结果保持原始顺序"""
+    lines = iter(lines)
+    head = list(itertools.islice(lines, min_lines))
+    if len(head) < min_lines or _parse_workers() <= 1:
+        return parse_proxy_urls(itertools.chain(head, lines))
+    
+    pool = _get_parse_pool()
+    max_pending = _parse_workers() * 2
+    pending = deque()
+    nodes = []
+    chunks = itertools.chain(
+        (head[i:i + chunk_size] for i in range(0, len(head), chunk_size)),
+        iter(lambda: list(itertools.islice(lines, chunk_size)), [])
+    )
+    # 限制在途任务数，保证流式输入时内存占用有上限；按提交顺序取回结果
+    for chunk in chunks:
+        pending.append(pool.submit(parse_proxy_chunk, chunk))
+        if len(pending) >= max_pending:
+            nodes.extend(pending.popleft().result())
+    while pending:
+        nodes.extend(pending.popleft().result())
+    return nodes
+
+def _parse_base64(content):
+    decoded = decode_base64(content)
+    if not decoded:
+        return None
+    nodes = parse_proxy_lines(decoded.split('\n'))
+    if nodes:
+        print(f"  ✓ 解析为Base64编码格式，找到 {len(nodes)} 个节点")
+        return nodes
+    return None
+
+def _parse_plain(content):
+    # 每行一个代理链接
+    nodes = parse_proxy_lines(content.split('\n'))
+    if nodes:
+        print(f"  ✓ 解析为纯文本格式，找到 {len(nodes)} 个节点")
+        return nodes
+    return None
+
+# Base64字母表之外的字节（含空白）在流式解码前剔除，与b64decode的非严格模式一致
+_BASE64_ALPHABET = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+_BASE64_NOISE = bytes(b for b in range(256) if b not in _BASE64_ALPHABET)
+
+def _iter_text_lines(text_chunks):
+    """把文本块拼接成行，逐行产出"""
+    tail = ''
+    for text in text_chunks:
+        if not text:
+            continue
+        lines = (tail + text).split('\n')
+        tail = lines.pop()
+        yield from lines
+    if tail:
+        yield tail
+
+def iter_base64_lines(chunks):
+    """增量解码Base64字节块，逐行产出解码后的文本"""
+    def decoded_chunks():
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        pending = b''
+        for chunk in chunks:
+            data = pending + chunk.translate(None, _BASE64_NOISE)
+            cut = len(data) - len(data) % 4
+            pending = data[cut:]
+            if cut:
+                yield decoder.decode(base64.b64decode(data[:cut]))
+        if pending:
+            yield decoder.decode(base64.b64decode(pending + b'=' * (-len(pending) % 4)))
+        yield decoder.decode(b'', final=True)
+    return _iter_text_lines(decoded_chunks())
+
+def iter_plain_lines(chunks, encoding='utf-8'):
+    """增量解码文本字节块，逐行产出"""
+    def decoded_chunks():
+        decoder = codecs.getincrementaldecoder(encoding)('replace')
+        for chunk in chunks:
+            yield decoder.decode(chunk)
+        yield decoder.decode(b'', final=True)
+    return _iter_text_lines(decoded_chunks())
+
+FORMAT_PARSERS = {
+    'json': _parse_json,
+    'yaml': _parse_yaml,
+    'base64': _parse_base64,
+    'plain': _parse_plain,
+}
+
+def parse_subscription_content(content, content_type=''):
+    """解析订阅内容（JSON/YAML/Base64/纯文本），返回节点列表或None"""
+    content = content.strip()
+    detected = detect_format(content, content_type)
+    
+    # 直接使用检测到的格式解析，仅在失败时再尝试其他格式
+    for fmt in (detected,) + tuple(f for f in FORMAT_ORDER if f != detected):
         try:
-            config = yaml.safe_load(content)
-            if isinstance(config, dict) and 'proxies' in config:
-                nodes = config['proxies']
-                print(f"  ✓ 解析为YAML格式，找到 {len(nodes)} 个节点")
-                return nodes
+            nodes = FORMAT_PARSERS[fmt](content)
         except Exception as e:
-            pass
-        
-        # 尝试解析为Base64编码的代理列表
-        decoded = decode_base64(content)
-        if decoded:
-            lines = decoded.split('\n')
-            nodes = []
-            for line in lines:
-                line = line.strip()
-                if line and (line.startswith('ss://') or line.startswith('vmess://') or 
-                           line.startswith('trojan://') or line.startswith('vless://') or
-                           line.startswith('hysteria2://') or line.startswith('hysteria://')):
-                    node = parse_proxy_url(line)
-                    if node:
-                        nodes.append(node)
-            if nodes:
-                print(f"  ✓ 解析为Base64编码格式，找到 {len(nodes)} 个节点")
-                return nodes
-        
-        # 尝试直接解析为代理列表（每行一个）
-        lines = content.split('\n')
-        nodes = []
-        for line in lines:
-            line = line.strip()
-            if line and (line.startswith('ss://') or line.startswith('vmess://') or 
-                       line.startswith('trojan://') or line.startswith('vless://') or
-                       line.startswith('hysteria2://') or line.startswith('hysteria://')):
-                node = parse_proxy_url(line)
-                if node:
-                    nodes.append(node)
-        
+            nodes = None
         if nodes:
-            print(f"  ✓ 解析为纯文本格式，找到 {len(nodes)} 个节点")
             return nodes
-        
-        # 如果都没有解析成功，打印内容预览以便调试
-        content_preview = content[:200] if len(content) > 200 else content
-        print(f"  ⚠️  无法解析内容格式，内容预览: {content_preview}...")
+    
+    # 如果都没有解析成功，打印内容预览以便调试
+    content_preview = content[:200] if len(content) > 200 else content
+    print(f"  ⚠️  无法解析内容格式，内容预览: {content_preview}...")
+    return None
+
+def _stale_nodes(url):
+    """获取失败时使用上次成功的节点列表"""
+    if not (SUBSCRIPTION_CACHE_ENABLED and STALE_IF_ERROR):
         return None
-        
+    nodes = subscription_cache.load_stale_nodes(url, STALE_MAX_AGE)
+    if nodes:
+        print(f"  ↺ 使用缓存中上次成功的 {len(nodes)} 个节点")
+    return nodes
+
+def _response_charset(response):
+    """从Content-Type中取字符集，未声明时按UTF-8处理"""
+    content_type = response.headers.get('Content-Type', '')
+    for param in content_type.split(';')[1:]:
+        key, _, value = param.strip().partition('=')
+        if key.lower() == 'charset' and value:
+            try:
+                return codecs.lookup(value.strip('"\' ')).name
+            except LookupError:
+                break
+    return 'utf-8'
+
+def _spool_chunks(spool):
+    """从头逐块读取备份文件"""
+    spool.seek(0)
+    return iter(lambda: spool.read(STREAM_CHUNK_SIZE), b'')
+
+def _parse_stream(response, fmt, chunks):
+    """流式解析大体积的Base64/纯文本订阅，内存占用与订阅大小无关"""
+    label = 'Base64编码格式' if fmt == 'base64' else '纯文本格式'
+    try:
+        if fmt == 'base64':
+            nodes = parse_proxy_lines(iter_base64_lines(chunks))
+        else:
+            nodes = parse_proxy_lines(iter_plain_lines(chunks, _response_charset(response)))
     except Exception as e:
-        print(f"  ❌ 获取订阅链接失败: {str(e)[:200]}")
-        import traceback
-        traceback.print_exc()
-        return None
+        print(f"  ⚠️  流式解析为{label}失败: {str(e)[:100]}")
+        nodes = None
+    if nodes:
+        print(f"  ✓ 流式解析为{label}，找到 {len(nodes)} 个节点")
+    return nodes or None
 
-def sanitize_node_name(name):
-    """清理节点名称，移除可能导致问题的特殊字符"""
-    if not name:
-        return name
+def _fetch_fresh(url, timeout, hedge_delay=None, timing=None):
+    """从订阅源获取并解析节点，失败时返回None（不使用过期缓存），timing同_download"""
+    headers = {
+        'User-Agent': USER_AGENT
+    }
     
-    import re
-    name = name.strip()
+    entry = subscription_cache.load_entry(url) if SUBSCRIPTION_CACHE_ENABLED else None
+    request_headers = dict(headers)
+    request_headers.update(subscription_cache.conditional_headers(entry))
     
-    # 移除控制字符
-    name = re.sub(r'[\x00-\x08\x0b-\x0c\x0e-\x1f\x7f-\x9f]', '', name)
-    
-    # 移除末尾已有的 "(数字)" 以免重复
-    name = re.sub(r'\s*\(\d+\)\s*$', '', name)
+    response = _download(url, request_headers, timeout, hedge_delay, timing)
+    if response is None:
+        return None
     
-    # 仅保留常见字符：中英文字母、数字、常用符号，其他替换为空
-    allowed_pattern = r'[^0-9A-Za-z\u4e00-\u9fff\-\_\.\s\[\]\(\):/|]'
-    name = re.sub(allowed_pattern, '', name)
+    # 订阅未变化，直接使用缓存的解析结果
+    if response.status_code == 304 and entry:
+        response.close()
+        nodes = subscription_cache.load_parsed(entry.get('body_hash'))
+        if nodes:
+            subscription_cache.touch_entry(url, entry)
+            print(f"  ✓ 订阅未变化（304），使用缓存的 {len(nodes)} 个节点")
+            return nodes
+        # 缓存文件丢失，重新完整请求
+        response = _download(url, headers, timeout, hedge_delay, timing)
+        if response is None:
+            return None
     
-    # 合并连续空格
-    name = re.sub(r'\s+', ' ', name)
+    with response:
+        content_type = response.headers.get('Content-Type', '')
+        chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+        
+        # 先读取至多STREAM_THRESHOLD_BYTES字节，小订阅整体处理
+        buffered = []
+        size = 0
+        for chunk in chunks:
+            buffered.append(chunk)
+            size += len(chunk)
+            if size >= STREAM_THRESHOLD_BYTES:
+                break
+        
+        nodes = None
+        body_hash = None
+        if size >= STREAM_THRESHOLD_BYTES:
+            head = b''.join(buffered)[:4096].decode('utf-8', 'replace')
+            fmt = detect_format(head, content_type)
+            if fmt in ('base64', 'plain'):
+                # 先把完整内容写入备份文件（超过阈值后落盘）并计算哈希，内容未变化时
+                # 直接使用缓存的解析结果；否则从备份文件流式解析
+                hasher = hashlib.sha256()
+                with tempfile.SpooledTemporaryFile(max_size=STREAM_THRESHOLD_BYTES) as spool:
+                    for chunk in itertools.chain(buffered, chunks):
+                        hasher.update(chunk)
+                        spool.write(chunk)
+                    buffered = None
+                    body_hash = hasher.hexdigest()
+                    if SUBSCRIPTION_CACHE_ENABLED:
+                        nodes = subscription_cache.load_parsed(body_hash)
+                        if nodes:
+                            subscription_cache.save_result(url, response.headers, body_hash, nodes)
+                            print(f"  ✓ 内容未变化，跳过解析，使用缓存的 {len(nodes)} 个节点")
+                            return nodes
+                    nodes = _parse_stream(response, fmt, _spool_chunks(spool))
+                    if not nodes:
+                        # 格式判断错误时按完整格式链重新解析
+                        body = b''.join(_spool_chunks(spool))
+                        nodes = parse_subscription_content(body.decode(_response_charset(response), 'replace'), content_type)
+                        body = None
+            else:
+                buffered.extend(chunks)
+        
+        if body_hash is None:
+            body = b''.join(buffered)
+            buffered = None
+            body_hash = subscription_cache.hash_content(body)
+            if SUBSCRIPTION_CACHE_ENABLED:
+                nodes = subscription_cache.load_parsed(body_hash)
+                if nodes:
+                    subscription_cache.save_result(url, response.headers, body_hash, nodes)
+                    print(f"  ✓ 内容未变化，跳过解析，使用缓存的 {len(nodes)} 个节点")
+                    return nodes
+            nodes = parse_subscription_content(body.decode(_response_charset(response), 'replace'), content_type)
     
-    # 限制长度
-    if len(name) > 80:
-        name = name[:80]
+    if not nodes:
+        return None
     
-    return name or None
+    if SUBSCRIPTION_CACHE_ENABLED:
+        try:
+            subscription_cache.save_result(url, response.headers, body_hash, nodes)
+        except Exception as e:
+            print(f"  ⚠️  写入订阅缓存失败: {str(e)[:100]}")
+    return nodes
 
-def ensure_unique_name(name, seen_names, name_counters):
-    """确保节点名称唯一"""
-    if not name:
-        return None
+def fetch_subscription(url, timeout=None):
+    """获取订阅链接内容（timeout为None时使用该订阅源的自适应超时）"""
+    health = source_health.get_health()
     
-    base_name = name
-    counter = name_counters.get(base_name, 0)
+    # 熔断中的订阅源直接使用缓存的节点列表
+    if not health.allow(url):
+        retry_at = time.strftime('%Y-%m-%d %H:%M', time.localtime(health.open_until(url)))
+        print(f"  ⏸  订阅源连续失败，已熔断，将于 {retry_at} 后重试")
+        return _stale_nodes(url)
     
-    unique_name = base_name if counter == 0 else f"{base_name}-{counter}"
-    counter += 1
+    if timeout is None:
+        timeout = health.timeout_for(url)
+    hedge_delay = health.hedge_delay(url) if HEDGE_ENABLED else None
     
-    while unique_name in seen_names:
-        unique_name = f"{base_name}-{counter}"
-        counter += 1
+    # 自适应超时和对冲延迟针对的是等待响应头的时间，只记录这部分，不含下载和解析
+    timing = {}
+    try:
+        nodes = _fetch_fresh(url, timeout, hedge_delay, timing)
+    except Exception as e:
+        print(f"  ❌ 获取订阅链接失败: {str(e)[:200]}")
+        import traceback
+        traceback.print_exc()
+        nodes = None
     
-    seen_names.add(unique_name)
-    name_counters[base_name] = counter
-    return unique_name
+    if nodes:
+        health.record_success(url, timing['response'])
+        return nodes
+    health.record_failure(url)
+    return _stale_nodes(url)
 
-def fetch_all_subscriptions(urls):
-    """获取所有订阅链接的节点"""
+def fetch_subscriptions_concurrently(urls, max_workers=FETCH_MAX_WORKERS, per_host_limit=FETCH_PER_HOST_LIMIT):
+    """并发获取所有订阅链接，返回与urls顺序一致的结果列表"""
+    if not urls:
+        return []
+    
+    # 每个主机一个信号量，避免同时向同一主机发起过多请求
+    host_semaphores = {}
+    for url in urls:
+        host = urlparse(url).netloc.lower()
+        if host not in host_semaphores:
+            host_semaphores[host] = threading.BoundedSemaphore(per_host_limit)
+    
+    def worker(index, url):
+        semaphore = host_semaphores[urlparse(url).netloc.lower()]
+        with semaphore:
+            print(f"[{index}/{len(urls)}] 正在获取订阅: {url}")
+            try:
+                return fetch_subscription(url)
+            except Exception as e:
+                print(f"  ❌ 获取订阅链接失败: {str(e)[:200]}")
+                return None
+    
+    workers = max(1, min(max_workers, len(urls)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(worker, i, url) for i, url in enumerate(urls, 1)]
+        # 按配置顺序收集结果，保证输出与响应先后无关
+        return [future.result() for future in futures]
+
+def fetch_all_subscriptions(urls, state=None):
+    """获取所有订阅链接的节点（传入NodeState时复用未变化节点的清理结果和名称，并保存本次状态）"""
     all_nodes = []
-    seen_names = set()
     seen_identifiers = set()  # 用于去重：server:port:type:uuid的组合
-    name_counters = {}  # 用于记录每个基础名称的计数
+    records = state.records() if state is not None else {}
     
-    for i, url in enumerate(urls, 1):
-        print(f"\n[{i}/{len(urls)}] 正在获取订阅: {url}")
-        nodes = fetch_subscription(url)
+    start_time = time.time()
+    results = fetch_subscriptions_concurrently(urls)
+    print(f"\n并发获取完成，耗时 {time.time() - start_time:.1f} 秒")
+    
+    for i, (url, nodes) in enumerate(zip(urls, results), 1):
+        print(f"\n[{i}/{len(urls)}] 处理订阅: {url}")
         if nodes and len(nodes) > 0:
             added_count = 0
             for node in nodes:
@@ -425,30 +553,33 @@ def fetch_all_subscriptions(urls):
                 server = node.get('server', '')
                 port = node.get('port', 0)
                 node_type = node.get('type', '')
-                uuid = node.get('uuid', '') or node.get('password', '') or ''  # UUID或密码作为标识
-                identifier = f"{node_type}:{server}:{port}:{uuid}"
+                identifier = node_identity(node)
                 
                 # 如果标识符已存在，跳过（真正的重复节点）
                 if identifier in seen_identifiers:
                     continue
                 
                 seen_identifiers.add(identifier)
+                fingerprint = node_fingerprint(node)
+                raw_name = node.get('name', '')
                 
-                # 获取并清理节点名称
-                node_name = node.get('name', '')
-                node_name = sanitize_node_name(node_name)
-                
-                # 如果名称为空，生成一个
-                if not node_name:
-                    node_name = f"{node_type}-{server}-{port}"
+                # 未变化的节点直接复用上次清理后的名称
+                record = records.get(identifier)
+                if (record and record['fingerprint'] == fingerprint
+                        and record['raw_name'] == raw_name and record['clean_name']):
+                    node_name = record['clean_name']
+                else:
+                    # 获取并清理节点名称
+                    node_name = sanitize_node_name(raw_name)
+                    
+                    # 如果名称为空，生成一个
+                    if not node_name:
+                        node_name = f"{node_type}-{server}-{port}"
                 
-                # 确保名称唯一
-                unique_name = ensure_unique_name(node_name, seen_names, name_counters)
-                if not unique_name:
-                    fallback_name = f"{node_type}-{server}-{port}-{uuid[:8] if uuid else i}"
-                    unique_name = ensure_unique_name(fallback_name, seen_names, name_counters)
-                
-                node['name'] = unique_name
+                node['_identity'] = identifier
+                node['_fingerprint'] = fingerprint
+                node['_raw_name'] = raw_name
+                node['_clean_name'] = node_name
                 all_nodes.append(node)
                 added_count += 1
             
@@ -456,26 +587,23 @@ def fetch_all_subscriptions(urls):
         else:
             print(f"  ✗ 未获取到节点")
     
-    # 最终检查：确保所有节点名称唯一
-    final_names = {}
-    duplicate_count = 0
-    for node in all_nodes:
-        node_name = node.get('name', '')
-        if node_name in final_names:
-            duplicate_count += 1
-            # 为重复的名称添加后缀
-            counter = final_names[node_name] + 1
-            new_name = f"{node_name}-{counter}"
-            while new_name in final_names:
-                counter += 1
-                new_name = f"{node_name}-{counter}"
-            node['name'] = new_name
-            final_names[new_name] = 1
-        else:
-            final_names[node_name] = 1
-    
+    # 统一分配唯一名称（优先沿用上次运行的名称）
+    previous_names = {identity: record['name'] for identity, record in records.items() if record['name']}
+    duplicate_count = assign_names(all_nodes, previous_names)
     if duplicate_count > 0:
-        print(f"  ⚠️  检测到 {duplicate_count} 个重复名称，已自动修复")
+        print(f"  ⚠️  检测到 {duplicate_count} 个重复名称，已自动添加后缀")
+    
+    if state is not None:
+        changes = state.classify(all_nodes)
+        print(f"  节点变化: 新增 {len(changes['new'])}，变化 {len(changes['changed'])}，"
+              f"未变化 {len(changes['unchanged'])}，消失 {len(changes['gone'])}")
+        state.record_seen(all_nodes)
+    
+    if SUBSCRIPTION_CACHE_ENABLED:
+        subscription_cache.prune_parsed()
+    http_sessions.get_pool().save()
+    source_health.get_health().save()
+    shutdown_parse_pool()
     
     print(f"\n{'='*60}")
     print(f"总共获取到 {len(all_nodes)} 个唯一节点")
@@ -3,8 +3,69 @@
 """
 Clash配置生成模块
 """
+import io
+import os
+import re
 import yaml
-from config import CLASH_CONFIG_TEMPLATE, RULES
+from config import (
+    CLASH_CONFIG_TEMPLATE, RULES, HISTORY_WEIGHT,
+    PROVIDER_DIR, PROVIDER_BASE_URL, PROXY_PROVIDER_INTERVAL, RULE_PROVIDER_INTERVAL
+)
+from naming import NameAllocator
+
+# 优先使用libyaml的C输出器
+_YamlDumper = getattr(yaml, 'CDumper', yaml.Dumper)
+
+# 分批输出的顶层列表，避免一次性生成整个文档
+STREAMED_KEYS = ('proxies', 'proxy-groups')
+STREAM_BATCH_SIZE = 500  # 每批输出的列表项数
+
+# 需要特殊处理的字符：BMP以外的字符（替换为占位符），以及两种输出器处理方式
+# 不同的控制字符、换行符、BOM、私用区字符（用作占位符）等（遇到时改用纯Python输出器）
+_SPECIAL_CHARS = re.compile('[\x00-\x1f\x7f-\x9f\u2028\u2029\ud800-\udfff\ue000-\uf8ff\ufeff\ufffe\uffff\U00010000-\U0010ffff]')
+_PRIVATE_USE = re.compile('[\ue000-\uf8ff]')
+
+class _BmpMapper:
+    """
+    libyaml把BMP以外的字符（如国旗emoji）视为不可打印，输出为 "\\U..." 转义，
+    而纯Python输出器原样输出。输出前把这些字符换成未使用的私用区字符，
+    输出后再换回，使C输出器的结果与纯Python输出器相同。
+    """
+    
+    def __init__(self):
+        self.forward = {}
+        self.reverse = {}
+    
+    def _char(self, match):
+        ch = match.group()
+        if ch <= '\uffff':
+            raise ValueError("数据包含需要纯Python输出器处理的字符")
+        placeholder = self.forward.get(ch)
+        if placeholder is None:
+            code = 0xE000 + len(self.forward)
+            if code > 0xF8FF:
+                raise ValueError("BMP以外的字符种类过多")
+            placeholder = self.forward[ch] = chr(code)
+            self.reverse[code] = ch
+        return placeholder
+    
+    def map(self, value):
+        """返回替换后的数据；含有无法安全替换的字符时抛出ValueError"""
+        if isinstance(value, str):
+            return _SPECIAL_CHARS.sub(self._char, value)
+        if isinstance(value, dict):
+            return {self.map(k): self.map(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.map(v) for v in value]
+        return value
+
+def node_rank(node):
+    """排序依据：本次测速评分（没有时用延迟），有历史记录时与历史EWMA延迟混合"""
+    score = node.get('_score', node.get('latency', 9999))
+    ewma = node.get('_ewma')
+    if ewma is None:
+        return score
+    return HISTORY_WEIGHT * ewma + (1 - HISTORY_WEIGHT) * score
 
 def generate_clash_config(nodes):
     """生成Clash配置文件"""
@@ -13,7 +74,7 @@ def generate_clash_config(nodes):
     config = CLASH_CONFIG_TEMPLATE.copy()
     
     # 最终检查：确保所有节点名称唯一
-    seen_names = set()
+    allocator = NameAllocator()
     unique_nodes = []
     duplicate_count = 0
     
@@ -25,28 +86,26 @@ def generate_clash_config(nodes):
             port = node.get('port', 0)
             node_type = node.get('type', 'proxy')
             node_name = f"{node_type}-{server}-{port}"
-            node['name'] = node_name
         
         # 确保名称唯一
-        original_name = node_name
-        counter = 1
-        while node_name in seen_names:
-            node_name = f"{original_name}-{counter}"
-            counter += 1
+        if not allocator.claim(node_name):
+            node_name = allocator.allocate(node_name)
             duplicate_count += 1
         
         node['name'] = node_name
-        seen_names.add(node_name)
         unique_nodes.append(node)
     
     if duplicate_count > 0:
         print(f"  ⚠️  在生成配置时发现 {duplicate_count} 个重复名称，已自动修复")
     
-    # 按延迟排序节点
-    sorted_nodes = sorted(unique_nodes, key=lambda x: x.get('latency', 9999))
+    # 按测速评分排序节点（综合中位数、抖动、丢包及历史延迟）
+    sorted_nodes = sorted(unique_nodes, key=node_rank)
     
-    # 添加节点列表
-    config['proxies'] = sorted_nodes
+    # 添加节点列表（以下划线开头的字段为内部状态，不写入配置）
+    config['proxies'] = [
+        {key: value for key, value in node.items() if not key.startswith('_')}
+        for node in sorted_nodes
+    ]
     
     # 创建代理组
     proxy_groups = [
@@ -136,11 +195,174 @@ def generate_clash_config(nodes):
     
     return config
 
+def split_providers(config, base_url=PROVIDER_BASE_URL, provider_dir=PROVIDER_DIR):
+    """
+    把完整配置拆分为主配置和provider文件
+    
+    节点写入proxy-provider文件：全部节点为 all，代理组中按排名取前N个节点的
+    列表为 top-N（其他组合为 group-序号）；代理组通过 use 引用。RULES中的每组规则写入rule-provider文件，
+    主配置中对应的规则改为 RULE-SET。返回 (主配置, {相对路径: 文件内容})。
+    """
+    base_url = base_url.rstrip('/')
+    proxies = config.get('proxies', [])
+    names = [proxy['name'] for proxy in proxies]
+    by_name = {proxy['name']: proxy for proxy in proxies}
+    files = {}
+    proxy_providers = {}
+    provider_names = {}
+    
+    def proxy_provider(members):
+        key = tuple(members)
+        name = provider_names.get(key)
+        if name is None:
+            if members == names:
+                name = 'all'
+            elif members == names[:len(members)]:
+                name = f"top-{len(members)}"
+            else:
+                name = f"group-{len(proxy_providers) + 1}"
+            provider_names[key] = name
+            path = f"{provider_dir}/{name}.yaml"
+            files[path] = {'proxies': [by_name[member] for member in members]}
+            proxy_providers[name] = {
+                'type': 'http',
+                'url': f"{base_url}/{path}",
+                'path': f"./{path}",
+                'interval': PROXY_PROVIDER_INTERVAL,
+                'health-check': {
+                    'enable': True,
+                    'url': 'http://www.gstatic.com/generate_204',
+                    'interval': 300
+                }
+            }
+        return name
+    
+    groups = []
+    for group in config.get('proxy-groups', []):
+        members = group.get('proxies', [])
+        nodes = [member for member in members if member in by_name]
+        if not nodes:
+            groups.append(group)
+            continue
+        group = dict(group)
+        others = [member for member in members if member not in by_name]
+        group['use'] = [proxy_provider(nodes)]
+        if others:
+            group['proxies'] = others
+        else:
+            del group['proxies']
+        groups.append(group)
+    
+    rule_providers = {}
+    rule_sets = {}
+    for rule_name, rule_list in RULES.items():
+        path = f"{provider_dir}/rules/{rule_name}.yaml"
+        files[path] = {'payload': list(rule_list)}
+        rule_providers[rule_name] = {
+            'type': 'http',
+            'behavior': 'classical',
+            'format': 'yaml',
+            'url': f"{base_url}/{path}",
+            'path': f"./{path}",
+            'interval': RULE_PROVIDER_INTERVAL
+        }
+        for rule in rule_list:
+            rule_sets[f"{rule},{rule_name}"] = f"RULE-SET,{rule_name},{rule_name}"
+    
+    # 展开的规则替换为 RULE-SET，保持原有顺序
+    rules = []
+    seen = set()
+    for rule in config.get('rules', []):
+        rule_set = rule_sets.get(rule)
+        if rule_set is None:
+            rules.append(rule)
+        elif rule_set not in seen:
+            seen.add(rule_set)
+            rules.append(rule_set)
+    
+    main_config = {}
+    for key, value in config.items():
+        if key == 'proxies':
+            continue
+        if key == 'proxy-groups':
+            main_config['proxy-providers'] = proxy_providers
+            main_config['rule-providers'] = rule_providers
+            value = groups
+        elif key == 'rules':
+            value = rules
+        main_config[key] = value
+    return main_config, files
+
+def save_provider_files(files, provider_dir=PROVIDER_DIR):
+    """保存provider文件并删除不再引用的旧文件，返回是否全部成功"""
+    try:
+        for path, data in files.items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_yaml_file(data, path)
+        
+        removed = 0
+        keep = set(os.path.normpath(path) for path in files)
+        for root, _, filenames in os.walk(provider_dir):
+            for filename in filenames:
+                path = os.path.normpath(os.path.join(root, filename))
+                if filename.endswith('.yaml') and path not in keep:
+                    os.remove(path)
+                    removed += 1
+        print(f"provider文件已保存: {len(files)} 个" + (f"，删除 {removed} 个不再使用的文件" if removed else ""))
+        return True
+    except Exception as e:
+        print(f"保存provider文件失败: {str(e)}")
+        return False
+
+def _dump(data, stream, mapper=None, dumper=_YamlDumper):
+    if mapper is not None and dumper is not yaml.Dumper:
+        try:
+            mapped = mapper.map(data)
+        except ValueError:
+            # 无法安全替换时这一段使用纯Python输出器
+            dumper = yaml.Dumper
+        else:
+            buffer = io.StringIO()
+            yaml.dump(mapped, buffer, Dumper=dumper, allow_unicode=True, default_flow_style=False, sort_keys=False)
+            text = buffer.getvalue()
+            if not (mapper.reverse and _PRIVATE_USE.search(text)):
+                stream.write(text)
+                return
+            # 纯Python输出器在双引号字符串中会转义BMP以外的字符，含双引号时保守地重新输出
+            if '"' not in text:
+                stream.write(text.translate(mapper.reverse))
+                return
+            dumper = yaml.Dumper
+    yaml.dump(data, stream, Dumper=dumper, allow_unicode=True, default_flow_style=False, sort_keys=False)
+
+def write_clash_config(config, stream):
+    """
+    把配置逐段写入stream，输出与对整个配置调用 yaml.dump 逐字节相同
+    
+    顶层键逐个输出，proxies和proxy-groups分批输出（块格式下顶层各段互不影响）。
+    要求各批之间不共享同一个列表/字典对象，否则整体输出时会生成锚点和别名。
+    """
+    mapper = _BmpMapper()
+    for key, value in config.items():
+        if key in STREAMED_KEYS and isinstance(value, list) and value:
+            # 第一项与键一起输出，得到 "key:" 行，其余各项按批输出为 "- ..." 块
+            _dump({key: value[:1]}, stream, mapper)
+            for start in range(1, len(value), STREAM_BATCH_SIZE):
+                _dump(value[start:start + STREAM_BATCH_SIZE], stream, mapper)
+        else:
+            _dump({key: value}, stream, mapper)
+
+def _write_yaml_file(data, filename):
+    """先写临时文件再替换，避免留下写了一半的文件"""
+    tmp_path = f"{filename}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        write_clash_config(data, f)
+    os.replace(tmp_path, filename)
+
 def save_clash_config(config, filename='clash-config.yaml'):
     """保存Clash配置到文件"""
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            yaml.dump(config, f, allow_unicode=True, default_flow_style=False, sort_keys=False)
+        _write_yaml_file(config, filename)
         print(f"配置文件已保存: {filename}")
         return True
     except Exception as e:
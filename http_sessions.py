@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP会话池模块
+
+所有订阅请求共用一个带连接池的requests会话，cloudscraper客户端按主机
+延迟创建并复用；需要cloudscraper的主机会被记录到缓存目录，
+下次运行时直接走cloudscraper，不再先浪费一次普通请求。
+"""
+import json
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+import cloudscraper
+from config import CACHE_DIR, HTTP_POOL_MAXSIZE, SCRAPER_ROUTE_TTL
+
+SCRAPER_HOSTS_FILE = os.path.join(CACHE_DIR, 'scraper_hosts.json')
+
+class SessionPool:
+    """共享的requests会话与按主机复用的cloudscraper客户端"""
+    
+    def __init__(self, routes_file=SCRAPER_HOSTS_FILE, pool_maxsize=HTTP_POOL_MAXSIZE, route_ttl=SCRAPER_ROUTE_TTL):
+        self.routes_file = routes_file
+        self.pool_maxsize = pool_maxsize
+        self.route_ttl = route_ttl
+        self._lock = threading.Lock()
+        self._session = None
+        self._scrapers = {}
+        self._scraper_hosts = self._load_routes()
+        self._dirty = False
+    
+    def _load_routes(self):
+        try:
+            with open(self.routes_file, 'r', encoding='utf-8') as f:
+                routes = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(routes, dict):
+            return {}
+        now = time.time()
+        return {host: ts for host, ts in routes.items() if now - ts <= self.route_ttl}
+    
+    def session(self):
+        """获取共享的requests会话（禁用SSL验证）"""
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                # pool_connections为缓存的主机连接池数量，pool_maxsize为每个主机的连接数
+                adapter = HTTPAdapter(pool_connections=32, pool_maxsize=self.pool_maxsize)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.verify = False
+                self._session = session
+            return self._session
+    
+    def scraper(self, host):
+        """获取指定主机的cloudscraper客户端，首次使用时创建"""
+        with self._lock:
+            scraper = self._scrapers.get(host)
+            if scraper is None:
+                scraper = cloudscraper.create_scraper(
+                    browser={
+                        'browser': 'chrome',
+                        'platform': 'windows',
+                        'desktop': True
+                    },
+                    verify=False
+                )
+                self._scrapers[host] = scraper
+            return scraper
+    
+    def needs_scraper(self, host):
+        """该主机是否已知需要cloudscraper"""
+        with self._lock:
+            return host in self._scraper_hosts
+    
+    def mark_scraper(self, host):
+        """记录该主机需要cloudscraper"""
+        with self._lock:
+            self._scraper_hosts[host] = time.time()
+            self._dirty = True
+    
+    def mark_plain(self, host):
+        """该主机普通请求已可用，取消记录"""
+        with self._lock:
+            if self._scraper_hosts.pop(host, None) is not None:
+                self._dirty = True
+    
+    def save(self):
+        """将主机路由记录写入缓存目录"""
+        with self._lock:
+            if not self._dirty:
+                return
+            routes = dict(self._scraper_hosts)
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.routes_file), exist_ok=True)
+            tmp_path = self.routes_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(routes, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.routes_file)
+        except OSError as e:
+            print(f"  ⚠️  保存主机路由记录失败: {str(e)[:100]}")
+    
+    def close(self):
+        """关闭所有会话"""
+        with self._lock:
+            sessions = list(self._scrapers.values())
+            if self._session is not None:
+                sessions.append(self._session)
+            self._session = None
+            self._scrapers = {}
+        for session in sessions:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """获取全局会话池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SessionPool()
+        return _pool
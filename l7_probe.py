@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+协议层（L7）测速模块
+
+TCP连接成功只说明端口开着（Cloudflare等任播IP对任何连接都会应答），
+不代表节点背后的服务可用。本模块按节点协议完成握手，通过节点请求一个
+小的HTTP地址，测量收到首字节的时间：
+
+- trojan：TLS（可选WebSocket）+ trojan请求头
+- vless：可选TLS、可选WebSocket + vless请求头（不支持Reality）
+- ss：AEAD加密（aes-*-gcm / chacha20-ietf-poly1305），需要安装cryptography
+
+其他协议或传输方式（vmess、gRPC、Reality、ss-2022等）不做L7测速，保留TCP结果。
+"""
+import asyncio
+import base64
+import hashlib
+import ipaddress
+import os
+import ssl
+import struct
+import time
+import uuid
+from urllib.parse import urlsplit
+import resolver
+from config import L7_PROBE_URL, L7_PROBE_TIMEOUT, L7_PROBE_CONCURRENCY
+
+# 可选依赖：ss AEAD测速需要cryptography（pip install cryptography），未安装时ss节点保留TCP结果
+try:
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+except ImportError:
+    AESGCM = ChaCha20Poly1305 = None
+
+# 不支持的协议/传输方式
+UNSUPPORTED = 'unsupported'
+
+# ss AEAD加密方式: (密钥长度, AEAD类)
+SS_AEAD_CIPHERS = {
+    'aes-128-gcm': (16, AESGCM),
+    'aes-192-gcm': (24, AESGCM),
+    'aes-256-gcm': (32, AESGCM),
+    'chacha20-ietf-poly1305': (32, ChaCha20Poly1305),
+}
+SS_TAG_SIZE = 16
+SS_MAX_CHUNK = 0x3FFF
+
+class ProbeError(Exception):
+    """L7测速失败（握手失败、响应不是HTTP等）"""
+
+class RawStream:
+    """TCP/TLS连接"""
+    
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+    
+    async def write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+    
+    async def read(self):
+        return await self.reader.read(65536)
+    
+    def close(self):
+        self.writer.close()
+
+class WebSocketStream:
+    """在连接上收发WebSocket二进制帧（客户端帧带掩码）"""
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = BufferedStream(stream)
+    
+    async def handshake(self, path, host):
+        key = base64.b64encode(os.urandom(16)).decode()
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {host}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        )
+        await self.stream.write(request.encode())
+        head = await self.buffer.readuntil(b'\r\n\r\n')
+        status = head.split(b'\r\n', 1)[0].split()
+        if len(status) < 2 or status[1] != b'101':
+            raise ProbeError(f"WebSocket握手失败: {head[:64]!r}")
+    
+    async def write(self, data):
+        length = len(data)
+        if length < 126:
+            header = struct.pack('!BB', 0x82, 0x80 | length)
+        elif length < 65536:
+            header = struct.pack('!BBH', 0x82, 0x80 | 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x82, 0x80 | 127, length)
+        mask = os.urandom(4)
+        repeated = (mask * (length // 4 + 1))[:length]
+        masked = (int.from_bytes(data, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(length, 'big')
+        await self.stream.write(header + mask + masked)
+    
+    async def read(self):
+        while True:
+            first, second = await self.buffer.readexactly(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length, = struct.unpack('!H', await self.buffer.readexactly(2))
+            elif length == 127:
+                length, = struct.unpack('!Q', await self.buffer.readexactly(8))
+            mask = await self.buffer.readexactly(4) if second & 0x80 else None
+            payload = await self.buffer.readexactly(length)
+            if mask:
+                repeated = (mask * (length // 4 + 1))[:length]
+                payload = (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(length, 'big')
+            if opcode == 0x8:
+                return b''
+            if opcode in (0x0, 0x1, 0x2) and payload:
+                return payload
+            # ping/pong及空帧忽略
+    
+    def close(self):
+        self.stream.close()
+
+class BufferedStream:
+    """在read()接口之上提供按长度/分隔符读取"""
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.data = b''
+    
+    async def _fill(self):
+        chunk = await self.stream.read()
+        if not chunk:
+            raise ProbeError("连接被关闭")
+        self.data += chunk
+    
+    async def readexactly(self, n):
+        while len(self.data) < n:
+            await self._fill()
+        result, self.data = self.data[:n], self.data[n:]
+        return result
+    
+    async def readuntil(self, separator):
+        while separator not in self.data:
+            await self._fill()
+        index = self.data.index(separator) + len(separator)
+        result, self.data = self.data[:index], self.data[index:]
+        return result
+    
+    async def read(self):
+        if not self.data:
+            await self._fill()
+        result, self.data = self.data, b''
+        return result
+
+class ShadowsocksStream:
+    """ss AEAD加密流（SIP004）"""
+    
+    def __init__(self, stream, cipher, password):
+        key_size, aead = SS_AEAD_CIPHERS[cipher]
+        self.stream = stream
+        self.buffer = BufferedStream(stream)
+        self.key_size = key_size
+        self.aead = aead
+        self.master_key = _evp_bytes_to_key(password.encode(), key_size)
+        self.encryptor = None
+        self.decryptor = None
+    
+    def _subkey(self, salt):
+        return HKDF(
+            algorithm=hashes.SHA1(), length=self.key_size, salt=salt, info=b'ss-subkey'
+        ).derive(self.master_key)
+    
+    async def write(self, data):
+        prefix = b''
+        if self.encryptor is None:
+            salt = os.urandom(self.key_size)
+            self.encryptor = _NonceCipher(self.aead(self._subkey(salt)))
+            prefix = salt
+        out = [prefix]
+        for start in range(0, len(data), SS_MAX_CHUNK):
+            chunk = data[start:start + SS_MAX_CHUNK]
+            out.append(self.encryptor.encrypt(struct.pack('!H', len(chunk))))
+            out.append(self.encryptor.encrypt(chunk))
+        await self.stream.write(b''.join(out))
+    
+    async def read(self):
+        if self.decryptor is None:
+            salt = await self.buffer.readexactly(self.key_size)
+            self.decryptor = _NonceCipher(self.aead(self._subkey(salt)))
+        length, = struct.unpack('!H', self.decryptor.decrypt(await self.buffer.readexactly(2 + SS_TAG_SIZE)))
+        return self.decryptor.decrypt(await self.buffer.readexactly(length + SS_TAG_SIZE))
+    
+    def close(self):
+        self.stream.close()
+
+class _NonceCipher:
+    """每次加解密后nonce（小端计数器）加一"""
+    
+    def __init__(self, aead):
+        self.aead = aead
+        self.counter = 0
+    
+    def _nonce(self):
+        nonce = self.counter.to_bytes(12, 'little')
+        self.counter += 1
+        return nonce
+    
+    def encrypt(self, data):
+        return self.aead.encrypt(self._nonce(), data, None)
+    
+    def decrypt(self, data):
+        try:
+            return self.aead.decrypt(self._nonce(), data, None)
+        except Exception:
+            raise ProbeError("ss解密失败（密码或加密方式不匹配）")
+
+def _evp_bytes_to_key(password, key_size):
+    """OpenSSL EVP_BytesToKey（MD5），ss由密码派生主密钥的方式"""
+    key = b''
+    block = b''
+    while len(key) < key_size:
+        block = hashlib.md5(block + password).digest()
+        key += block
+    return key[:key_size]
+
+def socks_address(host, port):
+    """SOCKS5格式的目标地址（trojan和ss使用）"""
+    try:
+        ip = ipaddress.ip_address(host)
+    except ValueError:
+        encoded = host.encode('idna')
+        return b'\x03' + bytes([len(encoded)]) + encoded + struct.pack('!H', port)
+    atyp = b'\x01' if ip.version == 4 else b'\x04'
+    return atyp + ip.packed + struct.pack('!H', port)
+
+def vless_address(host, port):
+    """vless格式的目标地址：端口在前，地址类型 1=IPv4 2=域名 3=IPv6"""
+    try:
+        ip = ipaddress.ip_address(host)
+    except ValueError:
+        encoded = host.encode('idna')
+        return struct.pack('!H', port) + b'\x02' + bytes([len(encoded)]) + encoded
+    atyp = b'\x01' if ip.version == 4 else b'\x03'
+    return struct.pack('!H', port) + atyp + ip.packed
+
+def probe_target(url=L7_PROBE_URL):
+    """解析测速地址，返回 (host, port, HTTP请求)；只支持http://"""
+    parts = urlsplit(url)
+    if parts.scheme != 'http':
+        raise ValueError(f"L7测速地址只支持http://: {url}")
+    host = parts.hostname
+    port = parts.port or 80
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    request = f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nUser-Agent: Mozilla/5.0\r\nConnection: close\r\n\r\n"
+    return host, port, request.encode()
+
+def supports(node):
+    """节点是否支持L7测速"""
+    node_type = node.get('type')
+    if node.get('network', 'tcp') not in ('tcp', 'ws'):
+        return False
+    if node_type == 'trojan':
+        return True
+    if node_type == 'vless':
+        # Reality和XTLS流控（如xtls-rprx-vision）需要专门的握手，服务端会拒绝不带流控的请求
+        return 'reality-opts' not in node and not node.get('flow')
+    if node_type == 'ss':
+        return AESGCM is not None and node.get('cipher') in SS_AEAD_CIPHERS and 'plugin' not in node
+    return False
+
+_tls_contexts = {}
+
+def _tls_context(node):
+    """按是否校验证书复用TLS上下文（加载系统证书较慢，会阻塞事件循环）"""
+    verify = not node.get('skip-cert-verify')
+    context = _tls_contexts.get(verify)
+    if context is None:
+        context = ssl.create_default_context()
+        if not verify:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        _tls_contexts[verify] = context
+    return context
+
+async def _open_stream(node, address):
+    """建立到节点的连接，按节点配置套上TLS和WebSocket"""
+    use_tls = node['type'] == 'trojan' or node.get('tls')
+    sni = node.get('servername') or node.get('sni') or node['server']
+    reader, writer = await asyncio.open_connection(
+        address or node['server'], node['port'],
+        ssl=_tls_context(node) if use_tls else None,
+        server_hostname=sni if use_tls else None,
+    )
+    stream = RawStream(reader, writer)
+    if node.get('network') == 'ws':
+        ws_opts = node.get('ws-opts', {})
+        host = ws_opts.get('headers', {}).get('Host') or sni
+        stream = WebSocketStream(stream)
+        await stream.handshake(ws_opts.get('path', '/'), host)
+    return stream
+
+async def _l7_request(node, address, target):
+    host, port, request = target
+    node_type = node['type']
+    stream = await _open_stream(node, address)
+    try:
+        if node_type == 'trojan':
+            password = hashlib.sha224(node['password'].encode()).hexdigest().encode()
+            await stream.write(password + b'\r\n\x01' + socks_address(host, port) + b'\r\n' + request)
+            reader = BufferedStream(stream)
+        elif node_type == 'vless':
+            header = b'\x00' + uuid.UUID(node['uuid']).bytes + b'\x00\x01' + vless_address(host, port)
+            await stream.write(header + request)
+            reader = BufferedStream(stream)
+            # 响应头: 版本(1) + 附加信息长度(1) + 附加信息
+            _, addons = await reader.readexactly(2)
+            await reader.readexactly(addons)
+        else:
+            stream = ShadowsocksStream(stream, node['cipher'], node['password'])
+            await stream.write(socks_address(host, port) + request)
+            reader = BufferedStream(stream)
+        
+        status = await reader.readexactly(5)
+        if status != b'HTTP/':
+            raise ProbeError(f"响应不是HTTP: {status!r}")
+    finally:
+        stream.close()
+
+async def l7_latency(node, address=None, target=None, timeout=L7_PROBE_TIMEOUT):
+    """
+    通过节点请求测速地址，返回收到响应首字节的时间（毫秒）
+    
+    失败返回None，不支持的协议返回UNSUPPORTED。节点配置不完整或字段类型
+    不对（缺少password/uuid等）同样按测速失败处理，不影响其他节点。
+    """
+    if not supports(node):
+        return UNSUPPORTED
+    start_time = time.perf_counter_ns()
+    try:
+        await asyncio.wait_for(_l7_request(node, address, target or probe_target()), timeout=timeout)
+    except Exception:
+        return None
+    return round((time.perf_counter_ns() - start_time) / 1e6, 2)
+
+async def probe_nodes(nodes, concurrency=L7_PROBE_CONCURRENCY, timeout=L7_PROBE_TIMEOUT, url=L7_PROBE_URL):
+    """并发L7测速，返回与nodes顺序一致的结果列表（毫秒/None/UNSUPPORTED）"""
+    target = probe_target(url)
+    if AESGCM is None:
+        ss_count = sum(1 for node in nodes if node.get('type') == 'ss')
+        if ss_count:
+            print(f"  ⚠️  未安装cryptography，{ss_count} 个ss节点不做协议层测速（保留TCP结果）")
+    semaphore = asyncio.Semaphore(concurrency)
+    # TCP测速阶段已解析过这些域名，这里基本都命中缓存
+    resolved = await resolver.resolve_hosts(node.get('server', '') for node in nodes)
+    
+    async def probe(node):
+        # 优先使用TCP测速竞速胜出的地址
+        address = node.get('_address') or resolver.preferred_address(resolved.get(node.get('server', ''), []))
+        async with semaphore:
+            return await l7_latency(node, address, target, timeout)
+    
+    results = await asyncio.gather(*(probe(node) for node in nodes), return_exceptions=True)
+    return [None if isinstance(result, Exception) else result for result in results]
@@ -5,22 +5,55 @@
 """
 import sys
 import os
+import argparse
 from datetime import datetime
 from fetch_subscriptions import fetch_all_subscriptions
 from test_nodes import test_nodes
-from generate_clash import generate_clash_config, save_clash_config
-from config import SUBSCRIPTION_URLS, MAX_LATENCY
+from generate_clash import generate_clash_config, save_clash_config, split_providers, save_provider_files
+from node_state import NodeState
+from shards import parse_shard_spec, write_results, merge_results
+from config import SUBSCRIPTION_URLS, MAX_LATENCY, OUTPUT_MODE
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='订阅节点汇聚工具')
+    parser.add_argument('--shard', type=parse_shard_spec, metavar='I/N',
+                        help='只测试第I个分片（共N片，I从0开始），结果写入文件后退出')
+    parser.add_argument('--shard-output', metavar='PATH',
+                        help='分片测速结果文件（默认 probe-results-I-of-N.jsonl）')
+    parser.add_argument('--vantage', help='测速位置名称（默认为运行器名称或主机名）')
+    parser.add_argument('--merge', nargs='+', metavar='PATH',
+                        help='合并分片/多位置的测速结果并生成配置，跳过获取和测速')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    
     print("=" * 60)
     print("订阅节点汇聚工具")
     print("=" * 60)
     print(f"开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
     
+    if args.merge:
+        print("[1/2] 正在合并测速结果...")
+        try:
+            available_nodes = merge_results(args.merge, MAX_LATENCY)
+            if not available_nodes:
+                print("错误: 合并后没有可用的节点")
+                sys.exit(1)
+            print(f"✓ 合并完成，可用节点: {len(available_nodes)}\n")
+        except Exception as e:
+            print(f"错误: 合并测速结果失败 - {str(e)}")
+            sys.exit(1)
+        generate(available_nodes, "[2/2]")
+        return
+    
+    # 节点状态（跨运行保存，用于增量处理）
+    state = NodeState()
+    
     # 1. 获取订阅节点
     print("[1/3] 正在获取订阅节点...")
     try:
-        nodes = fetch_all_subscriptions(SUBSCRIPTION_URLS)
+        nodes = fetch_all_subscriptions(SUBSCRIPTION_URLS, state=state)
         if not nodes:
             print("错误: 未获取到任何节点")
             sys.exit(1)
@@ -32,7 +65,13 @@ def main():
     # 2. 测速并过滤
     print(f"[2/3] 正在测试节点延迟（过滤延迟>{MAX_LATENCY}ms的节点）...")
     try:
-        available_nodes = test_nodes(nodes, MAX_LATENCY)
+        available_nodes = test_nodes(nodes, MAX_LATENCY, state=state, shard=args.shard)
+        if args.shard:
+            index, count = args.shard
+            output = args.shard_output or f"probe-results-{index}-of-{count}.jsonl"
+            written = write_results(output, nodes, available_nodes, args.shard, args.vantage, MAX_LATENCY)
+            print(f"✓ 分片测速完成，可用节点: {len(available_nodes)}，{written} 条结果已写入 {output}")
+            return
         if not available_nodes:
             print("错误: 没有可用的节点（所有节点延迟都超过阈值）")
             sys.exit(1)
@@ -40,12 +79,23 @@ def main():
     except Exception as e:
         print(f"错误: 测速失败 - {str(e)}")
         sys.exit(1)
+    finally:
+        state.close()
     
-    # 3. 生成Clash配置
-    print("[3/3] 正在生成Clash配置文件...")
+    generate(available_nodes, "[3/3]")
+
+def generate(available_nodes, step):
+    # 生成Clash配置
+    print(f"{step} 正在生成Clash配置文件...")
     try:
         config = generate_clash_config(available_nodes)
         
+        # provider模式下节点和规则列表写入单独的文件，主配置通过 use/RULE-SET 引用
+        if OUTPUT_MODE == 'provider':
+            config, provider_files = split_providers(config)
+            if not save_provider_files(provider_files):
+                sys.exit(1)
+        
         # 保存到本地文件
         output_file = 'clash-config.yaml'
         if save_clash_config(config, output_file):
@@ -53,6 +103,8 @@ def main():
             print(f"  - 包含 {len(available_nodes)} 个可用节点")
             print(f"  - 包含 {len(config.get('rules', []))} 条分流规则")
             print(f"  - 包含 {len(config.get('proxy-groups', []))} 个代理组")
+            if OUTPUT_MODE == 'provider':
+                print(f"  - 引用 {len(config['proxy-providers'])} 个节点provider、{len(config['rule-providers'])} 个规则provider")
         else:
             print("错误: 保存配置文件失败")
             sys.exit(1)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+节点名称模块
+
+名称清理和唯一化在一处完成：正则预编译，唯一化按基础名称记录计数，
+整体线性时间；可传入上次运行的名称，使同一节点在顺序变化时保持原名。
+"""
+import re
+
+_CONTROL_CHARS = re.compile(r'[\x00-\x08\x0b-\x0c\x0e-\x1f\x7f-\x9f]')
+_TRAILING_COUNTER = re.compile(r'\s*\(\d+\)\s*$')
+# 仅保留常见字符：中英文字母、数字、常用符号
+_DISALLOWED_CHARS = re.compile(r'[^0-9A-Za-z\u4e00-\u9fff\-\_\.\s\[\]\(\):/|]')
+_WHITESPACE = re.compile(r'\s+')
+
+MAX_NAME_LENGTH = 80
+
+def sanitize_node_name(name):
+    """清理节点名称，移除可能导致问题的特殊字符"""
+    if not name:
+        return name
+    
+    name = str(name).strip()
+    
+    # 移除控制字符
+    name = _CONTROL_CHARS.sub('', name)
+    
+    # 移除末尾已有的 "(数字)" 以免重复
+    name = _TRAILING_COUNTER.sub('', name)
+    
+    name = _DISALLOWED_CHARS.sub('', name)
+    
+    # 合并连续空格
+    name = _WHITESPACE.sub(' ', name)
+    
+    # 限制长度
+    if len(name) > MAX_NAME_LENGTH:
+        name = name[:MAX_NAME_LENGTH]
+    
+    return name or None
+
+def _derived_from(name, base):
+    """name是否为base本身或base加 -数字 后缀"""
+    if name == base:
+        return True
+    prefix = base + '-'
+    return name.startswith(prefix) and name[len(prefix):].isdigit()
+
+class NameAllocator:
+    """节点名称分配器：同一基础名称依次分配 名称、名称-1、名称-2……"""
+    
+    def __init__(self):
+        self.used = set()
+        self.counters = {}
+    
+    def claim(self, name):
+        """占用指定名称，已被占用时返回False"""
+        if name in self.used:
+            return False
+        self.used.add(name)
+        return True
+    
+    def allocate(self, base_name):
+        """分配一个以base_name为基础的唯一名称"""
+        counter = self.counters.get(base_name, 0)
+        name = base_name if counter == 0 else f"{base_name}-{counter}"
+        # 计数只增不减，每个被跳过的名称只会被跳过一次，整体为线性时间
+        while name in self.used:
+            counter += 1
+            name = f"{base_name}-{counter}"
+        self.counters[base_name] = counter + 1
+        self.used.add(name)
+        return name
+
+def assign_names(nodes, previous_names=None, base_key='_clean_name'):
+    """为节点分配唯一名称，返回被改名（与基础名称不同）的节点数量
+    
+    previous_names为 {身份标识: 上次名称}，上次名称仍由同一基础名称派生时优先沿用，
+    这样节点增减或顺序变化时，客户端中已选择的节点名称不会变成另一个节点。
+    """
+    allocator = NameAllocator()
+    previous_names = previous_names or {}
+    pending = []
+    
+    for node in nodes:
+        base = node.get(base_key) or node.get('name') or \
+            f"{node.get('type', 'proxy')}-{node.get('server', 'unknown')}-{node.get('port', 0)}"
+        previous = previous_names.get(node.get('_identity'))
+        if previous and _derived_from(previous, base) and allocator.claim(previous):
+            node['name'] = previous
+        else:
+            pending.append((node, base))
+    
+    renamed = 0
+    for node, base in pending:
+        node['name'] = allocator.allocate(base)
+        if node['name'] != base:
+            renamed += 1
+    return renamed
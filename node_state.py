@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+节点状态模块
+
+用SQLite保存每个节点的身份标识、内容指纹、名称和最近一次测速结果，
+使每次运行能区分新增/变化/未变化/消失的节点，未变化的节点可跳过
+名称清理并在有效期内复用测速结果。
+
+另按指纹保存历史延迟（EWMA）和连续成功/失败次数，用于测速排序、
+失效节点的指数退避以及生成配置时的综合排序。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from config import (
+    CACHE_DIR, STATE_RETENTION, HISTORY_EWMA_ALPHA,
+    BACKOFF_MIN_FAILURES, BACKOFF_BASE, BACKOFF_MAX
+)
+
+STATE_DB = os.path.join(CACHE_DIR, 'state.db')
+
+# 不参与指纹计算的字段：名称会被重命名，latency等为测速结果
+_VOLATILE_KEYS = ('name', 'latency')
+
+def node_identity(node):
+    """节点身份标识（与去重使用的 type:server:port:uuid 一致）"""
+    server = node.get('server', '')
+    port = node.get('port', 0)
+    node_type = node.get('type', '')
+    uuid = node.get('uuid', '') or node.get('password', '') or ''  # UUID或密码作为标识
+    return f"{node_type}:{server}:{port}:{uuid}"
+
+def node_fingerprint(node):
+    """节点内容指纹：除名称和测速结果外所有字段的稳定哈希"""
+    content = {
+        key: value for key, value in node.items()
+        if key not in _VOLATILE_KEYS and not key.startswith('_')
+    }
+    data = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+class NodeState:
+    """基于SQLite的节点状态存储"""
+    
+    def __init__(self, path=STATE_DB):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS nodes (
+                identity TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                raw_name TEXT,
+                clean_name TEXT,
+                name TEXT,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                latency REAL,
+                probed_at REAL,
+                score REAL,
+                address TEXT,
+                ip_version TEXT
+            )
+        ''')
+        # 旧版本创建的数据库补充新增的列
+        columns = {row['name'] for row in self.conn.execute('PRAGMA table_info(nodes)')}
+        for column, column_type in (('score', 'REAL'), ('address', 'TEXT'), ('ip_version', 'TEXT')):
+            if column not in columns:
+                self.conn.execute(f'ALTER TABLE nodes ADD COLUMN {column} {column_type}')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS latency_history (
+                fingerprint TEXT PRIMARY KEY,
+                ewma REAL,
+                success_streak INTEGER NOT NULL DEFAULT 0,
+                fail_streak INTEGER NOT NULL DEFAULT 0,
+                last_seen REAL NOT NULL,
+                last_probe REAL,
+                next_probe REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        self.conn.commit()
+        self._records = None
+        self._history = None
+    
+    def records(self):
+        """读取全部节点记录，返回 {identity: dict}"""
+        if self._records is None:
+            rows = self.conn.execute('SELECT * FROM nodes').fetchall()
+            self._records = {row['identity']: dict(row) for row in rows}
+        return self._records
+    
+    def classify(self, nodes):
+        """按指纹将本次节点分为新增/变化/未变化，并给出已消失的身份标识"""
+        records = self.records()
+        result = {'new': [], 'changed': [], 'unchanged': [], 'gone': []}
+        seen = set()
+        for node in nodes:
+            identity = node['_identity']
+            seen.add(identity)
+            record = records.get(identity)
+            if record is None:
+                result['new'].append(node)
+            elif record['fingerprint'] != node['_fingerprint']:
+                result['changed'].append(node)
+            else:
+                result['unchanged'].append(node)
+        result['gone'] = [identity for identity in records if identity not in seen]
+        return result
+    
+    def record_seen(self, nodes):
+        """保存本次运行的节点，删除超过STATE_RETENTION未出现的记录"""
+        now = time.time()
+        records = self.records()
+        rows = []
+        for node in nodes:
+            record = records.get(node['_identity'])
+            unchanged = record is not None and record['fingerprint'] == node['_fingerprint']
+            rows.append((
+                node['_identity'],
+                node['_fingerprint'],
+                node.get('_raw_name'),
+                node.get('_clean_name'),
+                node.get('name'),
+                record['first_seen'] if record else now,
+                now,
+                # 内容变化后旧的测速结果不再可信
+                record['latency'] if unchanged else None,
+                record['probed_at'] if unchanged else None,
+                record['score'] if unchanged else None,
+                record['address'] if unchanged else None,
+                record['ip_version'] if unchanged else None,
+            ))
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.conn.execute('DELETE FROM nodes WHERE last_seen < ?', (now - STATE_RETENTION,))
+            self.conn.executemany(
+                'UPDATE latency_history SET last_seen = ? WHERE fingerprint = ?',
+                [(now, node['_fingerprint']) for node in nodes]
+            )
+            self.conn.execute('DELETE FROM latency_history WHERE last_seen < ?', (now - STATE_RETENTION,))
+        self._records = None
+        self._history = None
+    
+    def fresh_probe(self, node, max_age):
+        """
+        返回有效期内的测速结果：(是否命中, 结果)
+        
+        结果为 {'latency': 延迟, 'score': 综合评分, 'address': 竞速胜出的IP,
+        'ip_version': 双栈节点的IP偏好}，上次测速失败时为None。
+        """
+        record = self.records().get(node.get('_identity'))
+        if not record or record['fingerprint'] != node.get('_fingerprint'):
+            return False, None
+        if record['probed_at'] is None or time.time() - record['probed_at'] > max_age:
+            return False, None
+        if record['latency'] is None:
+            return True, None
+        return True, {
+            'latency': record['latency'],
+            'score': record['score'],
+            'address': record['address'],
+            'ip_version': record['ip_version'],
+        }
+    
+    def history(self):
+        """读取全部历史延迟记录，返回 {fingerprint: dict}"""
+        if self._history is None:
+            rows = self.conn.execute('SELECT * FROM latency_history').fetchall()
+            self._history = {row['fingerprint']: dict(row) for row in rows}
+        return self._history
+    
+    def history_for(self, node):
+        return self.history().get(node.get('_fingerprint'))
+    
+    def in_backoff(self, node):
+        """连续失败的节点在退避期内不再测速"""
+        record = self.history_for(node)
+        return record is not None and time.time() < record['next_probe']
+    
+    def record_probes(self, results):
+        """
+        保存测速结果并更新历史延迟，results为 [(node, latency或None)]
+        
+        通过的节点同时保存_score、_address和ip-version，复用结果时一并恢复。
+        """
+        now = time.time()
+        rows = []
+        for node, latency in results:
+            if not node.get('_identity'):
+                continue
+            passed = latency is not None
+            rows.append((
+                latency,
+                node.get('_score') if passed else None,
+                node.get('_address') if passed else None,
+                node.get('ip-version') if passed else None,
+                now,
+                node['_identity'],
+                node['_fingerprint'],
+            ))
+        history = self.history()
+        history_rows = []
+        for node, latency in results:
+            fingerprint = node.get('_fingerprint')
+            if not fingerprint:
+                continue
+            record = history.get(fingerprint) or {'ewma': None, 'success_streak': 0, 'fail_streak': 0}
+            if latency is not None:
+                ewma = latency if record['ewma'] is None else \
+                    HISTORY_EWMA_ALPHA * latency + (1 - HISTORY_EWMA_ALPHA) * record['ewma']
+                success_streak, fail_streak, next_probe = record['success_streak'] + 1, 0, 0
+            else:
+                ewma = record['ewma']
+                success_streak, fail_streak = 0, record['fail_streak'] + 1
+                next_probe = 0
+                if fail_streak >= BACKOFF_MIN_FAILURES:
+                    backoff = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (fail_streak - BACKOFF_MIN_FAILURES))
+                    next_probe = now + backoff
+            history_rows.append((fingerprint, ewma, success_streak, fail_streak, now, now, next_probe))
+        
+        with self.conn:
+            self.conn.executemany(
+                'UPDATE nodes SET latency = ?, score = ?, address = ?, ip_version = ?, probed_at = ? '
+                'WHERE identity = ? AND fingerprint = ?',
+                rows
+            )
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO latency_history VALUES (?, ?, ?, ?, ?, ?, ?)',
+                history_rows
+            )
+        self._records = None
+        self._history = None
+    
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测速调度模块
+
+替代单一信号量控制测速并发：
+- 每个目标IP、每个 /24（IPv6为 /64）网段同时进行的测速数量有上限，
+  避免对同一任播IP集中发起大量连接，导致测得的延迟虚高或触发限流；
+- 全局并发窗口按AIMD调整：测速正常时加性增大（开始阶段为慢启动），
+  出现拥塞信号（连接时间明显膨胀、已知可用的端点超时）时乘性减小。
+  只有在上次减小之后才开始的测速才会再次触发减小，同一波拥塞只减一次。
+
+等待中的测速按网段排队，网段之间轮转放行，同一网段内按IP排队。
+"""
+import asyncio
+import ipaddress
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from config import (
+    PROBE_PER_IP_LIMIT, PROBE_PER_SUBNET_LIMIT, PROBE_MIN_CONCURRENCY,
+    PROBE_INITIAL_CONCURRENCY, PROBE_AIMD_DECREASE, PROBE_INFLATION_RATIO, PROBE_INFLATION_MIN
+)
+
+def subnet_of(address):
+    """IPv4按 /24、IPv6按 /64 归并网段"""
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return address
+    prefix = 24 if ip.version == 4 else 64
+    return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+
+class ProbeScheduler:
+    """按目标IP/网段限流、全局并发按AIMD自适应的测速调度器"""
+    
+    def __init__(self, max_concurrency, per_ip=PROBE_PER_IP_LIMIT, per_subnet=PROBE_PER_SUBNET_LIMIT,
+                 initial=PROBE_INITIAL_CONCURRENCY, min_concurrency=PROBE_MIN_CONCURRENCY):
+        self.max = max(1, max_concurrency)
+        self.min = max(1, min(min_concurrency, self.max))
+        self.limit = float(min(max(initial, self.min), self.max))
+        self.per_ip_limit = per_ip
+        self.per_subnet_limit = per_subnet
+        self.slow_start = True
+        self.last_decrease = 0
+        self.decreases = 0
+        self.peak = self.limit
+        
+        self.in_flight = 0
+        self.per_ip = Counter()
+        self.per_subnet = Counter()
+        # 网段 -> IP -> 等待中的future队列
+        self.waiting = OrderedDict()
+    
+    def _can_run(self, ip, subnet):
+        return (self.in_flight < int(self.limit)
+                and self.per_ip[ip] < self.per_ip_limit
+                and self.per_subnet[subnet] < self.per_subnet_limit)
+    
+    def _grant(self, ip, subnet):
+        self.in_flight += 1
+        self.per_ip[ip] += 1
+        self.per_subnet[subnet] += 1
+    
+    def _dispatch(self):
+        """在窗口和各项上限允许的范围内，按网段轮转放行等待中的测速"""
+        progress = True
+        while progress and self.waiting and self.in_flight < int(self.limit):
+            progress = False
+            for subnet in list(self.waiting):
+                if self.per_subnet[subnet] >= self.per_subnet_limit:
+                    continue
+                ips = self.waiting[subnet]
+                for ip, queue in ips.items():
+                    if self.per_ip[ip] < self.per_ip_limit:
+                        break
+                else:
+                    continue
+                future = queue.popleft()
+                if not queue:
+                    del ips[ip]
+                if not ips:
+                    del self.waiting[subnet]
+                else:
+                    self.waiting.move_to_end(subnet)
+                self._grant(ip, subnet)
+                future.set_result(None)
+                progress = True
+                if self.in_flight >= int(self.limit):
+                    break
+    
+    def _remove_waiter(self, ip, subnet, future):
+        ips = self.waiting.get(subnet)
+        if ips is None or ip not in ips:
+            return
+        try:
+            ips[ip].remove(future)
+        except ValueError:
+            return
+        if not ips[ip]:
+            del ips[ip]
+        if not ips:
+            del self.waiting[subnet]
+    
+    async def acquire(self, address):
+        ip, subnet = address, subnet_of(address)
+        if not self.waiting and self._can_run(ip, subnet):
+            self._grant(ip, subnet)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.setdefault(subnet, OrderedDict()).setdefault(ip, deque()).append(future)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已放行但任务被取消，归还名额
+                self.release(address)
+            else:
+                self._remove_waiter(ip, subnet, future)
+            raise
+    
+    def release(self, address):
+        self.in_flight -= 1
+        self.per_ip[address] -= 1
+        self.per_subnet[subnet_of(address)] -= 1
+        self._dispatch()
+    
+    @asynccontextmanager
+    async def slot(self, address):
+        await self.acquire(address)
+        try:
+            yield
+        finally:
+            self.release(address)
+    
+    def report(self, latency, reference, started):
+        """
+        反馈一次测速结果，调整全局并发窗口
+        
+        latency为本次延迟（毫秒，失败为None），reference为该端点的参考延迟
+        （本次运行中更早样本的最小值或历史EWMA，未知为None），
+        started为本次测速开始的 perf_counter_ns。
+        """
+        if latency is None:
+            # 未知端点超时可能只是节点失效，不作为拥塞信号
+            congested = reference is not None
+        else:
+            congested = (reference is not None
+                         and latency > reference * PROBE_INFLATION_RATIO
+                         and latency - reference > PROBE_INFLATION_MIN)
+        
+        if congested:
+            if started >= self.last_decrease:
+                self.limit = max(self.min, self.limit * PROBE_AIMD_DECREASE)
+                self.last_decrease = time.perf_counter_ns()
+                self.slow_start = False
+                self.decreases += 1
+        elif latency is not None:
+            increase = 1 if self.slow_start else 1 / self.limit
+            self.limit = min(self.max, self.limit + increase)
+            self.peak = max(self.peak, self.limit)
+            self._dispatch()
+    
+    def summary(self):
+        return f"并发窗口 当前 {int(self.limit)}，峰值 {int(self.peak)}，拥塞降速 {self.decreases} 次"
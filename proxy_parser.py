@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代理链接解析模块
+
+每种协议一个解析函数，通过 PROXY_PARSERS 按 scheme 一次查表分派。
+新增协议只需用 @register_parser 注册一个函数，不影响已有协议的速度。
+"""
+import base64
+import gc
+import json
+from functools import lru_cache
+from urllib.parse import unquote
+
+PROXY_PARSERS = {}
+
+def register_parser(*schemes):
+    """注册协议解析函数，解析函数接收去掉 'scheme://' 之后的部分"""
+    def decorator(func):
+        for scheme in schemes:
+            PROXY_PARSERS[scheme] = func
+        return func
+    return decorator
+
+def decode_base64(content):
+    """解码Base64内容"""
+    try:
+        decoded = base64.b64decode(content)
+        return decoded.decode('utf-8')
+    except:
+        return None
+
+@lru_cache(maxsize=4096)
+def parse_query(query):
+    """解析查询字符串为(key, value)元组；同一订阅中大量节点共用相同参数，结果会被缓存"""
+    params = []
+    for param in query.split('&'):
+        if '=' in param:
+            key, value = param.split('=', 1)
+            params.append((key, unquote(value)))
+    return tuple(params)
+
+def _split_host_port(server_port):
+    """拆分 host:port（IPv6地址需用方括号，如 [2001:db8::1]:443），格式不符时返回None"""
+    host, sep, port = server_port.rpartition(':')
+    if not sep or not host:
+        return None
+    if host.startswith('[') and host.endswith(']'):
+        host = host[1:-1]
+    elif ':' in host:
+        # 不带方括号的IPv6地址无法区分端口
+        return None
+    return host, int(port)
+
+def _split_name(body):
+    """拆分 主体#名称"""
+    parts = body.split('#')
+    return parts[0], (parts[1] if len(parts) > 1 else '')
+
+@register_parser('vless')
+def parse_vless(body):
+    # VLESS格式: vless://uuid@server:port?params#name
+    main, name = _split_name(body)
+    main_part = main.split('?')
+    server_part = main_part[0].split('@')
+    if len(server_part) != 2:
+        return None
+    host_port = _split_host_port(server_part[1])
+    if not host_port:
+        return None
+    server, port = host_port
+    node = {
+        'name': name or f"VLESS-{server}:{port}",
+        'type': 'vless',
+        'server': server,
+        'port': port,
+        'uuid': server_part[0],
+        'tls': False
+    }
+    if len(main_part) > 1:
+        for key, value in parse_query(main_part[1]):
+            if key == 'type':
+                node['network'] = value
+            elif key == 'security':
+                # Reality是VLESS的变体，同样需要TLS
+                if value == 'tls' or value == 'reality':
+                    node['tls'] = True
+            elif key == 'sni':
+                node['servername'] = value
+            elif key == 'host':
+                node.setdefault('ws-opts', {}).setdefault('headers', {})['Host'] = value
+            elif key == 'path':
+                node.setdefault('ws-opts', {})['path'] = value
+            # Reality 参数
+            elif key == 'pbk' or key == 'public-key':
+                node.setdefault('reality-opts', {})['public-key'] = value
+            elif key == 'sid' or key == 'short-id':
+                node.setdefault('reality-opts', {})['short-id'] = value
+            elif key == 'fp' or key == 'client-fingerprint':
+                node['client-fingerprint'] = value
+    return node
+
+@register_parser('ss')
+def parse_ss(body):
+    # SS格式: ss://base64(method:password)@server:port#name
+    main, name = _split_name(body)
+    main_part = main.split('@')
+    if len(main_part) != 2:
+        return None
+    host_port = _split_host_port(main_part[1])
+    if not host_port:
+        return None
+    decoded = decode_base64(main_part[0] + '==')
+    if not decoded:
+        return None
+    method_password = decoded.split(':')
+    if len(method_password) != 2:
+        return None
+    server, port = host_port
+    return {
+        'name': name or f"SS-{server}:{port}",
+        'type': 'ss',
+        'server': server,
+        'port': port,
+        'cipher': method_password[0],
+        'password': method_password[1]
+    }
+
+@register_parser('vmess')
+def parse_vmess(body):
+    # VMess格式: vmess://base64(json)
+    decoded = decode_base64(body)
+    if not decoded:
+        return None
+    vmess_config = json.loads(decoded)
+    node = {
+        'name': vmess_config.get('ps', vmess_config.get('add', 'VMess')),
+        'type': 'vmess',
+        'server': vmess_config.get('add', ''),
+        'port': int(vmess_config.get('port', 0)),
+        'uuid': vmess_config.get('id', ''),
+        'cipher': vmess_config.get('scy', 'auto'),
+        'network': vmess_config.get('net', 'tcp')
+    }
+    
+    # alterId字段（旧版VMess需要）
+    aid = vmess_config.get('aid', 0)
+    if aid:
+        node['alterId'] = int(aid)
+    
+    # WebSocket配置
+    if vmess_config.get('net') == 'ws':
+        ws_opts = {
+            'path': vmess_config.get('path', '/')
+        }
+        host = vmess_config.get('host', '')
+        if host:
+            ws_opts['headers'] = {'Host': host}
+        node['ws-opts'] = ws_opts
+    
+    # TLS配置
+    if vmess_config.get('tls') in ['tls', '1']:
+        node['tls'] = True
+        sni = vmess_config.get('sni') or vmess_config.get('host', '')
+        if sni:
+            node['servername'] = sni
+    
+    # skip-cert-verify (如果需要)
+    if vmess_config.get('skip-cert-verify'):
+        node['skip-cert-verify'] = True
+    return node
+
+@register_parser('trojan')
+def parse_trojan(body):
+    # Trojan格式: trojan://password@server:port#name
+    main, name = _split_name(body)
+    main_part = main.split('@')
+    if len(main_part) != 2:
+        return None
+    host_port = _split_host_port(main_part[1])
+    if not host_port:
+        return None
+    server, port = host_port
+    return {
+        'name': name or f"Trojan-{server}:{port}",
+        'type': 'trojan',
+        'server': server,
+        'port': port,
+        'password': main_part[0]
+    }
+
+@register_parser('hysteria2', 'hysteria')
+def parse_hysteria2(body):
+    # Hysteria2格式: hysteria2://password@server:port?params#name
+    # 也支持旧版hysteria://
+    main, name = _split_name(body)
+    main_part = main.split('?')
+    server_part = main_part[0].split('@')
+    if len(server_part) != 2:
+        return None
+    host_port = _split_host_port(server_part[1])
+    if not host_port:
+        return None
+    server, port = host_port
+    node = {
+        'name': name or f"Hysteria2-{server}:{port}",
+        'type': 'hysteria2',
+        'server': server,
+        'port': port,
+        'password': server_part[0]
+    }
+    if len(main_part) > 1:
+        for key, value in parse_query(main_part[1]):
+            if key == 'sni' or key == 'peer':
+                node['sni'] = value
+            elif key == 'insecure':
+                if value.lower() in ['true', '1', 'yes']:
+                    node['skip-cert-verify'] = True
+            elif key == 'obfs':
+                obfs = node.setdefault('obfs', {})
+                if value.startswith('salamander'):
+                    # salamander:password
+                    obfs_parts = value.split(':')
+                    if len(obfs_parts) == 2:
+                        obfs['type'] = 'salamander'
+                        obfs['password'] = obfs_parts[1]
+            elif key == 'obfs-password':
+                obfs = node.setdefault('obfs', {})
+                obfs.setdefault('type', 'salamander')
+                obfs['password'] = value
+            elif key == 'bandwidth' or key == 'up' or key == 'down':
+                # Hysteria2 带宽设置
+                bandwidth = node.setdefault('bandwidth', {})
+                if key == 'up':
+                    bandwidth['up'] = value
+                elif key == 'down':
+                    bandwidth['down'] = value
+    return node
+
+PROXY_SCHEMES = tuple(f"{scheme}://" for scheme in PROXY_PARSERS)
+
+def parse_proxy_url(proxy_url):
+    """解析代理URL（ss://, vmess://, trojan://, vless://等）"""
+    scheme, sep, body = proxy_url.partition('://')
+    parser = PROXY_PARSERS.get(scheme) if sep else None
+    if parser is None:
+        return None
+    try:
+        node = parser(body)
+    except Exception:
+        return None
+    return node if node and node.get('server') else None
+
+def parse_proxy_urls(lines):
+    """批量解析代理链接，lines可以是任意可迭代对象（包括生成器），返回节点列表"""
+    parsers = PROXY_PARSERS
+    nodes = []
+    append = nodes.append
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        scheme, sep, body = line.partition('://')
+        parser = parsers.get(scheme) if sep else None
+        if parser is None:
+            continue
+        try:
+            node = parser(body)
+        except Exception:
+            continue
+        if node and node.get('server'):
+            append(node)
+    return nodes
+
+def parse_proxy_chunk(lines):
+    """
+    解析进程池工作进程中的一块代理链接
+    
+    节点字典不含循环引用，批量解析期间暂停循环GC，避免节点越多越频繁地全量扫描。
+    GC开关是进程级状态，只能在单线程的工作进程中使用，不要在获取订阅的线程中调用。
+    """
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return parse_proxy_urls(lines)
+    finally:
+        if gc_enabled:
+            gc.enable()
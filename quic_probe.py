@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+QUIC（UDP）测速模块
+
+hysteria/hysteria2/tuic 节点只监听UDP，用TCP连接测速要么超时，要么碰巧
+连上同端口的无关TCP服务。这里发送一个使用保留版本号的QUIC长包头数据包
+（填充到1200字节），按RFC 9000第6节，QUIC服务端会立即回复版本协商包，
+以此测量往返时间，无需完成TLS握手。
+
+hysteria2的salamander混淆会先对整个UDP数据包解混淆，因此带混淆密码的
+节点同样按salamander规则混淆探测包并还原响应。其他混淆（如hysteria v1的obfs）
+无法复现，这些节点不做测速。
+"""
+import asyncio
+import hashlib
+import os
+import socket
+import time
+
+# 需要UDP/QUIC测速的节点类型
+QUIC_TYPES = ('hysteria', 'hysteria2', 'tuic')
+
+# 保留版本号（0x?a?a?a?a形式），服务端必然不支持从而回复版本协商
+PROBE_VERSION = bytes.fromhex('1a2a3a4a')
+# 客户端Initial包的最小长度，服务端对更短的包可以不回复
+PACKET_SIZE = 1200
+CONNECTION_ID_SIZE = 8
+SALAMANDER_SALT_SIZE = 8
+
+def needs_quic(node):
+    return node.get('type') in QUIC_TYPES
+
+def obfs_password(node):
+    """hysteria2的salamander混淆密码，没有混淆时返回None"""
+    if node.get('type') != 'hysteria2':
+        return None
+    obfs = node.get('obfs')
+    if isinstance(obfs, dict) and obfs.get('type') == 'salamander':
+        return obfs.get('password') or None
+    # Clash配置中的写法: obfs: salamander, obfs-password: xxx
+    if obfs == 'salamander':
+        return node.get('obfs-password') or None
+    return None
+
+def obfs_supported(node):
+    """
+    能否复现节点的UDP混淆
+    
+    只实现了hysteria2的salamander；hysteria v1的obfs（字符串密码，xplus混淆）
+    等其他混淆的节点对未混淆的探测包不会回复，无法用QUIC探测判断是否可用。
+    """
+    return not node.get('obfs') or obfs_password(node) is not None
+
+def _salamander(password, salt, data):
+    key = hashlib.blake2b(password.encode() + salt, digest_size=32).digest()
+    repeated = (key * (len(data) // len(key) + 1))[:len(data)]
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(len(data), 'big')
+
+def salamander_obfuscate(password, packet):
+    salt = os.urandom(SALAMANDER_SALT_SIZE)
+    return salt + _salamander(password, salt, packet)
+
+def salamander_deobfuscate(password, datagram):
+    if len(datagram) <= SALAMANDER_SALT_SIZE:
+        return b''
+    salt = datagram[:SALAMANDER_SALT_SIZE]
+    return _salamander(password, salt, datagram[SALAMANDER_SALT_SIZE:])
+
+def build_probe_packet(password=None):
+    """构造探测包，返回 (数据包, 目标连接ID, 源连接ID)"""
+    dcid = os.urandom(CONNECTION_ID_SIZE)
+    scid = os.urandom(CONNECTION_ID_SIZE)
+    # 长包头 + 固定位，类型为Initial
+    header = bytes([0xC0 | (os.urandom(1)[0] & 0x0F)]) + PROBE_VERSION
+    header += bytes([len(dcid)]) + dcid + bytes([len(scid)]) + scid
+    size = PACKET_SIZE - (SALAMANDER_SALT_SIZE if password else 0)
+    packet = header + os.urandom(size - len(header))
+    if password:
+        packet = salamander_obfuscate(password, packet)
+    return packet, dcid, scid
+
+def is_version_negotiation(datagram, dcid, scid, password=None):
+    """响应是否为针对本次探测的版本协商包（连接ID需与发送的互换对应）"""
+    if password:
+        datagram = salamander_deobfuscate(password, datagram)
+    if len(datagram) < 7 or not datagram[0] & 0x80 or datagram[1:5] != b'\x00\x00\x00\x00':
+        return False
+    pos = 5
+    length = datagram[pos]
+    if datagram[pos + 1:pos + 1 + length] != scid:
+        return False
+    pos += 1 + length
+    length = datagram[pos] if pos < len(datagram) else -1
+    return datagram[pos + 1:pos + 1 + length] == dcid
+
+class _ProbeProtocol(asyncio.DatagramProtocol):
+    def __init__(self, dcid, scid, password):
+        self.dcid = dcid
+        self.scid = scid
+        self.password = password
+        self.done = asyncio.get_running_loop().create_future()
+    
+    def datagram_received(self, data, addr):
+        if not self.done.done() and is_version_negotiation(data, self.dcid, self.scid, self.password):
+            self.done.set_result(time.perf_counter_ns())
+    
+    def error_received(self, exc):
+        # 收到ICMP端口不可达等错误，立即判定失败
+        if not self.done.done():
+            self.done.set_exception(exc)
+
+async def quic_latency(address, port, timeout=5, password=None):
+    """测量QUIC版本协商往返时间（毫秒），失败返回None"""
+    loop = asyncio.get_running_loop()
+    packet, dcid, scid = build_probe_packet(password)
+    transport = None
+    try:
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: _ProbeProtocol(dcid, scid, password),
+            remote_addr=(address, port)
+        )
+        start_time = time.perf_counter_ns()
+        transport.sendto(packet)
+        end_time = await asyncio.wait_for(protocol.done, timeout=timeout)
+        return round((end_time - start_time) / 1e6, 2)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    finally:
+        if transport is not None:
+            transport.close()
+
+def quic_latency_sync(address, port, timeout=5, password=None):
+    """同步版本的QUIC测速（用于线程池）"""
+    packet, dcid, scid = build_probe_packet(password)
+    try:
+        family, _, _, _, sockaddr = socket.getaddrinfo(address, port, type=socket.SOCK_DGRAM)[0]
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(sockaddr)
+            start_time = time.perf_counter_ns()
+            deadline = time.monotonic() + timeout
+            sock.send(packet)
+            while True:
+                data = sock.recv(2048)
+                if is_version_negotiation(data, dcid, scid, password):
+                    return round((time.perf_counter_ns() - start_time) / 1e6, 2)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                sock.settimeout(remaining)
+    except OSError:
+        return None
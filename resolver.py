@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+域名解析模块
+
+测速前先并发解析所有不重复的主机名，解析结果带TTL缓存（可保存到缓存目录），
+测速时直接连接IP，使测得的延迟不包含DNS解析时间。
+"""
+import asyncio
+import ipaddress
+import json
+import os
+import socket
+import time
+from config import CACHE_DIR, DNS_CONCURRENCY, DNS_TIMEOUT, DNS_CACHE_TTL, DNS_CACHE_PERSIST
+
+DNS_CACHE_FILE = os.path.join(CACHE_DIR, 'dns_cache.json')
+
+def is_ip_literal(host):
+    """host是否为IP地址"""
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+def address_family(address):
+    return socket.AF_INET6 if ':' in address else socket.AF_INET
+
+class DnsCache:
+    """带TTL的域名解析缓存"""
+    
+    def __init__(self, path=DNS_CACHE_FILE, ttl=DNS_CACHE_TTL, persist=DNS_CACHE_PERSIST):
+        self.path = path
+        self.ttl = ttl
+        self.persist = persist
+        self._entries = self._load() if persist else {}
+        self._dirty = False
+    
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        now = time.time()
+        return {host: entry for host, entry in data.items() if entry.get('expires', 0) > now}
+    
+    def get(self, host):
+        """返回未过期的解析结果（IP列表），没有则返回None"""
+        entry = self._entries.get(host)
+        if entry is None:
+            return None
+        if entry['expires'] <= time.time():
+            del self._entries[host]
+            return None
+        return entry['addresses']
+    
+    def put(self, host, addresses):
+        self._entries[host] = {'addresses': addresses, 'expires': time.time() + self.ttl}
+        self._dirty = True
+    
+    def save(self):
+        """保存到缓存目录"""
+        if not self.persist or not self._dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            print(f"  ⚠️  保存DNS缓存失败: {str(e)[:100]}")
+
+_cache = None
+
+def get_dns_cache():
+    """获取全局DNS缓存"""
+    global _cache
+    if _cache is None:
+        _cache = DnsCache()
+    return _cache
+
+async def resolve_hosts(hosts, cache=None, concurrency=DNS_CONCURRENCY, timeout=DNS_TIMEOUT):
+    """并发解析主机名，返回 {host: [ip, ...]}，解析失败的主机对应空列表"""
+    cache = cache if cache is not None else get_dns_cache()
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def resolve(host):
+        if is_ip_literal(host):
+            return host, [host]
+        cached = cache.get(host)
+        if cached is not None:
+            return host, cached
+        async with semaphore:
+            try:
+                infos = await asyncio.wait_for(
+                    loop.getaddrinfo(host, None, type=socket.SOCK_STREAM),
+                    timeout=timeout
+                )
+            except (asyncio.TimeoutError, OSError, UnicodeError):
+                return host, []
+        addresses = _unique_addresses(infos)
+        cache.put(host, addresses)
+        return host, addresses
+    
+    results = await asyncio.gather(*(resolve(host) for host in set(hosts) if host))
+    return dict(results)
+
+def resolve_host_sync(host, cache=None):
+    """同步解析单个主机名（同步测速使用），返回IP列表，解析失败返回空列表"""
+    if is_ip_literal(host):
+        return [host]
+    cache = cache if cache is not None else get_dns_cache()
+    cached = cache.get(host)
+    if cached is not None:
+        return cached
+    try:
+        infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError):
+        return []
+    addresses = _unique_addresses(infos)
+    cache.put(host, addresses)
+    return addresses
+
+def _unique_addresses(infos):
+    addresses = []
+    for info in infos:
+        address = info[4][0]
+        if address not in addresses:
+            addresses.append(address)
+    return addresses
+
+def interleave_addresses(addresses, limit=None):
+    """
+    按RFC 8305排列竞速地址：以第一个地址的协议族开头，IPv6与IPv4交替
+    
+    addresses为getaddrinfo返回的顺序（已按系统地址选择策略排序）。
+    """
+    if not addresses:
+        return []
+    first_family = address_family(addresses[0])
+    primary = [a for a in addresses if address_family(a) == first_family]
+    secondary = [a for a in addresses if address_family(a) != first_family]
+    ordered = []
+    for i in range(max(len(primary), len(secondary))):
+        ordered.extend(group[i] for group in (primary, secondary) if i < len(group))
+    return ordered[:limit] if limit else ordered
+
+def is_dual_stack(addresses):
+    """地址列表是否同时包含IPv4和IPv6"""
+    return len(set(address_family(a) for a in addresses)) == 2
+
+def preferred_address(addresses):
+    """选择测速使用的地址（优先IPv4）"""
+    for address in addresses:
+        if address_family(address) == socket.AF_INET:
+            return address
+    return addresses[0] if addresses else None
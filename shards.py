@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分片测速与结果合并模块
+
+按节点指纹稳定哈希把节点池分成若干分片，由多个运行器各测一片；
+每个分片把测速结果写成紧凑的JSON Lines文件（首行为文件头），
+合并步骤再把多个分片、或多个测速位置（vantage）的结果合并成
+一份带评分的节点列表，交给generate_clash_config生成配置。
+"""
+import json
+import os
+import socket
+import statistics
+import time
+from node_state import node_fingerprint
+from config import PROBE_LOSS_PENALTY
+
+RESULT_FORMAT = 'probe-results'
+RESULT_VERSION = 1
+
+def parse_shard_spec(spec):
+    """解析分片参数 "index/count"（index从0开始），返回 (index, count)"""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"无效的分片参数: {spec}（格式为 序号/总数，如 0/4）")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"无效的分片参数: {spec}（序号需在 0 到 总数-1 之间）")
+    return index, count
+
+def shard_of(node, count):
+    """节点所属分片：对内容指纹取模，不同运行器上结果一致"""
+    fingerprint = node.get('_fingerprint') or node_fingerprint(node)
+    return int(fingerprint[:8], 16) % count
+
+def select_shard(nodes, index, count):
+    """只保留属于指定分片的节点"""
+    if count == 1:
+        return list(nodes)
+    return [node for node in nodes if shard_of(node, count) == index]
+
+def default_vantage():
+    """测速位置名称：GitHub Actions中使用运行器名称，否则使用主机名"""
+    return os.environ.get('RUNNER_NAME') or socket.gethostname()
+
+def _public_config(node):
+    return {key: value for key, value in node.items() if not key.startswith('_') and key != 'latency'}
+
+def write_results(path, nodes, available, shard=(0, 1), vantage=None, max_latency=None):
+    """
+    写出分片测速结果
+    
+    nodes为本分片的全部节点，available为测速通过的节点；
+    UDP混淆无法复现、未测速直接保留的节点写入 unprobed 标记，合并时排在末尾，
+    与不分片时的节点集合一致；其余未实际测速的节点（退避期内、提前停止时被取消等）
+    不写入，避免合并时被当作失败。
+    """
+    passed = set(id(node) for node in available if node.get('latency') is not None)
+    unprobed = set(id(node) for node in available if node.get('latency') is None and '_probe' not in node)
+    header = {
+        'format': RESULT_FORMAT,
+        'version': RESULT_VERSION,
+        'shard': f"{shard[0]}/{shard[1]}",
+        'vantage': vantage or default_vantage(),
+        'created': int(time.time()),
+        'max_latency': max_latency,
+    }
+    
+    count = 0
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(header, ensure_ascii=False, separators=(',', ':')) + '\n')
+        for node in nodes:
+            ok = id(node) in passed
+            if not ok and '_probe' not in node and id(node) not in unprobed:
+                continue
+            record = {
+                'fp': node.get('_fingerprint') or node_fingerprint(node),
+                'lat': node.get('latency') if ok else None,
+                'score': node.get('_score', node.get('latency')) if ok else None,
+                'node': _public_config(node),
+            }
+            if id(node) in unprobed:
+                record['unprobed'] = True
+            f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+def read_results(path):
+    """读取结果文件，返回 (header, records)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        header = json.loads(f.readline() or 'null')
+        if not isinstance(header, dict) or header.get('format') != RESULT_FORMAT:
+            raise ValueError(f"{path} 不是测速结果文件")
+        if header.get('version') != RESULT_VERSION:
+            raise ValueError(f"{path} 的结果格式版本不受支持: {header.get('version')}")
+        records = [json.loads(line) for line in f if line.strip()]
+    return header, records
+
+def merge_results(paths, max_latency=None):
+    """
+    合并多个结果文件，返回可用节点列表（带latency和_score）
+    
+    同一测速位置的不同分片互不重叠，直接拼接；多个测速位置测了同一节点时，
+    延迟取各位置通过结果的中位数，评分再按失败位置的比例加丢包惩罚。
+    任一位置测速通过即保留节点；只有未测速（unprobed）记录的节点不带延迟，排在末尾。
+    """
+    merged = {}
+    for path in paths:
+        header, records = read_results(path)
+        vantage = header.get('vantage')
+        print(f"  ✓ {path}: 分片 {header.get('shard')}，位置 {vantage}，{len(records)} 条结果")
+        for record in records:
+            entry = merged.setdefault(record['fp'], {'node': record['node'], 'results': {}})
+            # 同一位置重复出现时以后读入的为准
+            entry['results'][vantage] = record
+    
+    nodes = []
+    unprobed = []
+    for fingerprint, entry in merged.items():
+        results = [r for r in entry['results'].values() if not r.get('unprobed')]
+        passed = [r for r in results if r['lat'] is not None and (max_latency is None or r['lat'] <= max_latency)]
+        if not passed:
+            if not results:
+                node = dict(entry['node'])
+                node['_fingerprint'] = fingerprint
+                unprobed.append(node)
+            continue
+        node = dict(entry['node'])
+        node['latency'] = round(statistics.median(r['lat'] for r in passed), 2)
+        loss = 1 - len(passed) / len(results)
+        node['_score'] = round(statistics.median(r['score'] for r in passed) + PROBE_LOSS_PENALTY * loss, 2)
+        node['_fingerprint'] = fingerprint
+        nodes.append(node)
+    
+    print(f"合并 {len(paths)} 个结果文件：{len(merged)} 个节点，可用 {len(nodes)} 个，未测速保留 {len(unprobed)} 个")
+    return nodes + unprobed
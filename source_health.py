@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+订阅源健康状态模块
+
+记录每个订阅源最近的成功率和响应时间，据此给出自适应超时；
+连续失败或最近成功率过低的订阅源会被熔断，等待一段时间后再半开重试一次。
+"""
+import json
+import math
+import os
+import threading
+import time
+from config import (
+    CACHE_DIR, FETCH_TIMEOUT, FETCH_MIN_TIMEOUT, FETCH_TIMEOUT_FACTOR,
+    SOURCE_HISTORY_SIZE, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_MIN_SUCCESS_RATE, CIRCUIT_MIN_SAMPLES,
+    CIRCUIT_COOLDOWN, CIRCUIT_MAX_COOLDOWN,
+    HEDGE_PERCENTILE, HEDGE_MIN_DELAY, HEDGE_DEFAULT_DELAY
+)
+
+SOURCE_HEALTH_FILE = os.path.join(CACHE_DIR, 'source_health.json')
+
+def percentile(values, fraction):
+    """计算分位数（最近秩法）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+def _success_rate(source):
+    outcomes = source['outcomes'] if source else None
+    if not outcomes:
+        return None
+    return sum(outcomes) / len(outcomes)
+
+class SourceHealth:
+    """订阅源健康记录与熔断器"""
+    
+    def __init__(self, path=SOURCE_HEALTH_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sources = self._load()
+        self._dirty = False
+    
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+    
+    def _source(self, url):
+        return self._sources.setdefault(url, {
+            'outcomes': [],  # 最近的请求结果，1成功0失败
+            'durations': [],  # 最近成功请求收到响应头的耗时（秒，不含下载和解析）
+            'failures': 0,  # 连续失败次数
+            'trips': 0,  # 连续熔断次数
+            'open_until': 0,  # 熔断截止时间
+        })
+    
+    def allow(self, url):
+        """熔断中返回False；熔断时间已过则允许一次半开重试"""
+        with self._lock:
+            source = self._sources.get(url)
+            return not source or time.time() >= source.get('open_until', 0)
+    
+    def open_until(self, url):
+        with self._lock:
+            source = self._sources.get(url)
+            return source.get('open_until', 0) if source else 0
+    
+    def success_rate(self, url):
+        """最近请求的成功率，没有记录时返回None"""
+        with self._lock:
+            return _success_rate(self._sources.get(url))
+    
+    def timeout_for(self, url):
+        """根据该订阅源的历史响应时间（收到响应头的耗时）计算自适应超时"""
+        with self._lock:
+            source = self._sources.get(url)
+            durations = list(source['durations']) if source else []
+        if len(durations) < 3:
+            return FETCH_TIMEOUT
+        timeout = percentile(durations, 0.9) * FETCH_TIMEOUT_FACTOR + FETCH_MIN_TIMEOUT / 2
+        return max(FETCH_MIN_TIMEOUT, min(FETCH_TIMEOUT, timeout))
+    
+    def hedge_delay(self, url):
+        """主请求超过该订阅源历史响应时间的高分位数仍未返回时才发起对冲请求"""
+        with self._lock:
+            source = self._sources.get(url)
+            durations = list(source['durations']) if source else []
+        if len(durations) < 3:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, percentile(durations, HEDGE_PERCENTILE))
+    
+    def record_success(self, url, elapsed):
+        with self._lock:
+            source = self._source(url)
+            source['outcomes'] = (source['outcomes'] + [1])[-SOURCE_HISTORY_SIZE:]
+            source['durations'] = (source['durations'] + [round(elapsed, 3)])[-SOURCE_HISTORY_SIZE:]
+            source['failures'] = 0
+            source['trips'] = 0
+            source['open_until'] = 0
+            self._dirty = True
+    
+    def record_failure(self, url):
+        """记录一次失败，连续失败达到阈值（或半开重试失败）、或最近成功率过低时熔断"""
+        with self._lock:
+            source = self._source(url)
+            source['outcomes'] = (source['outcomes'] + [0])[-SOURCE_HISTORY_SIZE:]
+            source['failures'] += 1
+            # 时好时坏的订阅源很少连续失败，按滚动成功率判断
+            flapping = (len(source['outcomes']) >= CIRCUIT_MIN_SAMPLES
+                        and _success_rate(source) < CIRCUIT_MIN_SUCCESS_RATE)
+            if source['failures'] >= CIRCUIT_FAILURE_THRESHOLD or flapping:
+                cooldown = min(CIRCUIT_MAX_COOLDOWN, CIRCUIT_COOLDOWN * 2 ** source['trips'])
+                source['trips'] += 1
+                source['open_until'] = time.time() + cooldown
+            self._dirty = True
+    
+    def save(self):
+        """写入缓存目录"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.loads(json.dumps(self._sources))
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"  ⚠️  保存订阅源健康记录失败: {str(e)[:100]}")
+
+_health = None
+_health_lock = threading.Lock()
+
+def get_health():
+    """获取全局订阅源健康记录"""
+    global _health
+    with _health_lock:
+        if _health is None:
+            _health = SourceHealth()
+        return _health
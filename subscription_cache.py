@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+订阅缓存模块
+
+在本地磁盘上保存每个订阅的 ETag/Last-Modified 以发送条件请求，
+并以响应内容的哈希为键缓存解析后的节点列表。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from config import CACHE_DIR
+
+SUBSCRIPTION_DIR = os.path.join(CACHE_DIR, 'subscriptions')
+PARSED_DIR = os.path.join(CACHE_DIR, 'parsed')
+
+def hash_content(content):
+    """计算响应内容的哈希值"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+def _entry_path(url):
+    return os.path.join(SUBSCRIPTION_DIR, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+def _parsed_path(body_hash):
+    return os.path.join(PARSED_DIR, body_hash + '.json')
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_json(path, data):
+    """原子写入JSON文件，避免并发获取时读到半个文件"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def load_entry(url):
+    """读取订阅的缓存记录"""
+    entry = _read_json(_entry_path(url))
+    return entry if isinstance(entry, dict) else None
+
+def conditional_headers(entry):
+    """根据缓存记录生成条件请求头"""
+    headers = {}
+    if not entry:
+        return headers
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+def load_parsed(body_hash):
+    """按内容哈希读取已解析的节点列表（每次返回新的副本）"""
+    if not body_hash:
+        return None
+    nodes = _read_json(_parsed_path(body_hash))
+    return nodes if isinstance(nodes, list) else None
+
+def save_result(url, response_headers, body_hash, nodes):
+    """保存一次成功获取的结果"""
+    if nodes:
+        _write_json(_parsed_path(body_hash), nodes)
+    entry = load_entry(url) or {}
+    now = time.time()
+    entry.update({
+        'url': url,
+        'etag': response_headers.get('ETag'),
+        'last_modified': response_headers.get('Last-Modified'),
+        'body_hash': body_hash,
+        'fetched_at': now,
+    })
+    if nodes:
+        entry['good_hash'] = body_hash
+        entry['good_at'] = now
+    _write_json(_entry_path(url), entry)
+
+def touch_entry(url, entry):
+    """订阅未变化（304）时刷新记录时间"""
+    entry = dict(entry)
+    now = time.time()
+    entry['fetched_at'] = now
+    if entry.get('good_hash') == entry.get('body_hash'):
+        entry['good_at'] = now
+    _write_json(_entry_path(url), entry)
+
+def load_stale_nodes(url, max_age):
+    """读取上次成功的节点列表，超过max_age秒则视为不可用"""
+    entry = load_entry(url)
+    if not entry or not entry.get('good_hash'):
+        return None
+    if time.time() - entry.get('good_at', 0) > max_age:
+        return None
+    return load_parsed(entry['good_hash'])
+
+def prune_parsed():
+    """删除不再被任何订阅记录引用的解析缓存"""
+    referenced = set()
+    try:
+        names = os.listdir(SUBSCRIPTION_DIR)
+    except OSError:
+        names = []
+    for name in names:
+        entry = _read_json(os.path.join(SUBSCRIPTION_DIR, name))
+        if isinstance(entry, dict):
+            referenced.add(entry.get('body_hash'))
+            referenced.add(entry.get('good_hash'))
+    
+    removed = 0
+    try:
+        names = os.listdir(PARSED_DIR)
+    except OSError:
+        return 0
+    for name in names:
+        if name.endswith('.json') and name[:-5] not in referenced:
+            try:
+                os.remove(os.path.join(PARSED_DIR, name))
+                removed += 1
+            except OSError:
+                pass
+    return removed
@@ -4,132 +4,514 @@
 节点测速模块
 """
 import asyncio
+import math
 import socket
 import time
-from concurrent.futures import ThreadPoolExecutor
 import sys
+import resolver
+import l7_probe
+import quic_probe
+import clash_probe
+from probe_scheduler import ProbeScheduler
+from shards import select_shard
+from config import (
+    PROBE_FRESHNESS, PROBE_CONCURRENCY, PROBE_USE_UVLOOP,
+    PROBE_DEADLINE_MARGIN, PROBE_STOP_AFTER,
+    PROBE_SAMPLES, PROBE_CLEAR_MARGIN, PROBE_JITTER_WEIGHT, PROBE_LOSS_PENALTY,
+    L7_PROBE_ENABLED, L7_PROBE_TOP, HAPPY_EYEBALLS_DELAY, HAPPY_EYEBALLS_MAX_ADDRESSES,
+    PROBE_BACKEND, CLASH_PROBE_TOP
+)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 为标准输入输出、订阅缓存、数据库等预留的文件描述符数量
+FD_RESERVE = 64
 
 # Windows下设置事件循环策略
 if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-async def test_node_latency(node, timeout=5):
-    """测试节点延迟（TCP连接时间）"""
-    server = node.get('server', '')
-    port = node.get('port', 0)
+async def tcp_connect_latency(address, port, timeout=5):
+    """测量到 address:port 的TCP连接时间（毫秒），失败返回None"""
+    start_time = time.perf_counter_ns()
     
-    if not server or not port:
+    # 使用asyncio创建TCP连接测试延迟
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(address, port),
+            timeout=timeout
+        )
+    except (asyncio.TimeoutError, OSError, ValueError):
         return None
+    latency = (time.perf_counter_ns() - start_time) / 1e6  # 转换为毫秒
     
+    writer.close()
     try:
-        start_time = time.time()
-        
-        # 使用asyncio创建TCP连接测试延迟
-        try:
-            reader, writer = await asyncio.wait_for(
-                asyncio.open_connection(server, port),
-                timeout=timeout
-            )
-            latency = (time.time() - start_time) * 1000  # 转换为毫秒
-            writer.close()
-            await writer.wait_closed()
-            return round(latency, 2)
-        except asyncio.TimeoutError:
-            return None
-        except Exception as e:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return round(latency, 2)
+
+def latency_stats(latencies, attempts):
+    """根据成功样本计算中位数、P90、抖动和丢包率"""
+    loss = 1 - len(latencies) / attempts if attempts else 1.0
+    if not latencies:
+        return {'samples': attempts, 'median': None, 'p90': None, 'jitter': None, 'loss': loss}
+    ordered = sorted(latencies)
+    count = len(ordered)
+    if count % 2:
+        median = ordered[count // 2]
+    else:
+        median = (ordered[count // 2 - 1] + ordered[count // 2]) / 2
+    p90 = ordered[min(count - 1, max(0, math.ceil(0.9 * count) - 1))]
+    # 抖动：相邻样本差值绝对值的平均
+    jitter = sum(abs(b - a) for a, b in zip(latencies, latencies[1:])) / (count - 1) if count > 1 else 0.0
+    return {
+        'samples': attempts,
+        'median': round(median, 2),
+        'p90': round(p90, 2),
+        'jitter': round(jitter, 2),
+        'loss': round(loss, 3),
+    }
+
+def probe_score(stats):
+    """排序评分（越小越好）：中位数 + 抖动 + 丢包惩罚"""
+    if stats.get('median') is None:
+        return float('inf')
+    return round(stats['median'] + PROBE_JITTER_WEIGHT * stats['jitter'] + PROBE_LOSS_PENALTY * stats['loss'], 2)
+
+def probe_deadline(timeout, max_latency):
+    """单次连接的截止时间（秒）：超过延迟阈值（加少许余量）的连接无论如何都会被淘汰，无需等到timeout"""
+    return min(timeout, max_latency / 1000 * (1 + PROBE_DEADLINE_MARGIN))
+
+def probe_method(node):
+    """
+    节点的测速方式：TCP连接，或对UDP类协议发送QUIC探测包（附带salamander混淆密码）
+    
+    UDP混淆无法复现的节点返回None，这些节点不测速，保留在结果末尾。
+    """
+    if quic_probe.needs_quic(node):
+        if not quic_probe.obfs_supported(node):
             return None
-            
-    except Exception as e:
+        return ('quic', quic_probe.obfs_password(node))
+    return ('tcp', None)
+
+async def measure_latency(address, port, timeout=5, method=('tcp', None)):
+    """按测速方式测量一次延迟（毫秒），失败返回None"""
+    kind, password = method
+    if kind == 'quic':
+        return await quic_probe.quic_latency(address, port, timeout, password)
+    return await tcp_connect_latency(address, port, timeout)
+
+async def race_latency(addresses, port, timeout=5, method=('tcp', None), delay=HAPPY_EYEBALLS_DELAY):
+    """
+    RFC 8305（Happy Eyeballs）风格竞速测速
+    
+    按顺序发起各地址的测速，上一个地址失败或超过delay秒未完成时启动下一个，
+    第一个成功的地址胜出，其余取消。返回 (胜出地址自身的延迟, 胜出地址)，全部失败返回 (None, None)。
+    """
+    if len(addresses) == 1:
+        return await measure_latency(addresses[0], port, timeout, method), addresses[0]
+    
+    task_addresses = {}
+    pending = set()
+    next_index = 0
+    try:
+        while True:
+            if next_index < len(addresses):
+                task = asyncio.ensure_future(measure_latency(addresses[next_index], port, timeout, method))
+                task_addresses[task] = addresses[next_index]
+                pending.add(task)
+                next_index += 1
+            if not pending:
+                return None, None
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=delay if next_index < len(addresses) else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                latency = task.result()
+                if latency is not None:
+                    return latency, task_addresses[task]
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+async def probe_endpoint(address, port, timeout=5, max_latency=500, samples=PROBE_SAMPLES, method=('tcp', None),
+                         feedback=None, reference=None):
+    """对端点测速多次；结果（中位数是否低于max_latency）已确定时提前停止
+    
+    address可以是多个候选地址（双栈域名），此时首次测速按Happy Eyeballs竞速，
+    之后的样本沿用胜出的地址（与客户端缓存连接地址的行为一致），
+    胜出地址记录在结果的address中。
+    feedback(latency, reference, started) 在每次测速后调用，reference为该端点的参考延迟
+    （历史EWMA，有样本后取已有样本的最小值），用于调度器判断拥塞。
+    """
+    candidates = [address] if isinstance(address, str) else list(address)
+    winner = None
+    latencies = []
+    good = bad = attempts = 0
+    needed = samples // 2 + 1  # 决定中位数所需的样本数
+    for _ in range(samples):
+        started = time.perf_counter_ns()
+        latency, won = await race_latency([winner] if winner else candidates, port, timeout, method)
+        if won is not None:
+            winner = won
+        if feedback is not None:
+            feedback(latency, min(latencies) if latencies else reference, started)
+        attempts += 1
+        if latency is None or latency > max_latency:
+            bad += 1
+        else:
+            good += 1
+        if latency is not None:
+            latencies.append(latency)
+        # 过半样本超限（或失败），中位数不可能达标
+        if bad >= needed:
+            break
+        # 过半样本明显低于阈值，中位数必然达标
+        if good >= needed and max(latencies) <= max_latency * PROBE_CLEAR_MARGIN:
+            break
+    
+    stats = latency_stats(latencies, attempts)
+    # 失败样本按无穷大计入中位数判断
+    stats['passed'] = good >= needed
+    stats['address'] = winner
+    return stats
+
+async def test_node_latency(node, timeout=5, address=None):
+    """测试节点延迟（TCP连接或QUIC往返时间），address为预先解析好的IP，避免把DNS时间计入延迟"""
+    server = node.get('server', '')
+    port = node.get('port', 0)
+    
+    method = probe_method(node)
+    if not server or not port or method is None:
         return None
+    
+    return await measure_latency(address or server, port, timeout, method)
+
+def failed_probe():
+    """没有实际连接就判定失败（如域名无法解析）的测速结果"""
+    return dict(latency_stats([], 1), passed=False, address=None)
+
+def measure_latency_sync(addresses, port, timeout=5, method=('tcp', None)):
+    """
+    同步测速：依次尝试已解析的地址，返回 (延迟毫秒, 成功的地址)，全部失败返回 (None, None)
+    
+    地址需预先解析，计时只包含连接本身。
+    """
+    kind, password = method
+    for address in addresses:
+        if kind == 'quic':
+            latency = quic_probe.quic_latency_sync(address, port, timeout, password)
+        else:
+            try:
+                start_time = time.perf_counter_ns()
+                sock = socket.create_connection((address, port), timeout=timeout)
+                latency = round((time.perf_counter_ns() - start_time) / 1e6, 2)  # 转换为毫秒
+                sock.close()
+            except OSError:
+                latency = None
+        if latency is not None:
+            return latency, address
+    return None, None
 
 def test_node_latency_sync(node, timeout=5):
-    """同步版本的延迟测试（用于线程池）"""
+    """同步版本的延迟测试（用于线程池），域名在计时之前解析"""
     server = node.get('server', '')
     port = node.get('port', 0)
     
-    if not server or not port:
+    method = probe_method(node)
+    if not server or not port or method is None:
         return None, None
     
+    addresses = resolver.interleave_addresses(resolver.resolve_host_sync(server), HAPPY_EYEBALLS_MAX_ADDRESSES)
+    latency, _ = measure_latency_sync(addresses, port, timeout, method)
+    return node, latency
+
+def probe_concurrency(requested):
+    """根据文件描述符上限确定实际并发数，必要时尝试提高软限制"""
+    if resource is None:
+        return requested
     try:
-        start_time = time.time()
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(timeout)
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ValueError, OSError):
+        return requested
+    needed = requested + FD_RESERVE
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(hard, needed)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError):
+            pass
+    if soft == resource.RLIM_INFINITY:
+        return requested
+    return max(1, min(requested, soft - FD_RESERVE))
+
+def new_event_loop():
+    """创建事件循环，已安装uvloop时优先使用"""
+    if PROBE_USE_UVLOOP:
+        try:
+            import uvloop
+            return uvloop.new_event_loop()
+        except ImportError:
+            pass
+    return asyncio.new_event_loop()
+
+async def test_nodes_async(nodes, max_latency=500, timeout=5, max_workers=PROBE_CONCURRENCY, stop_after=PROBE_STOP_AFTER):
+    """异步测试所有节点（事件循环中直接发起连接，信号量控制并发数）
+    
+    stop_after大于0时，确认这么多可用节点后取消其余尚未完成的测速。
+    """
+    # 先统一解析域名，测速阶段只连接IP
+    start_time = time.time()
+    resolved = await resolver.resolve_hosts(node.get('server', '') for node in nodes)
+    failed_hosts = sum(1 for addresses in resolved.values() if not addresses)
+    print(f"解析 {len(resolved)} 个主机，耗时 {time.time() - start_time:.1f} 秒，失败 {failed_hosts} 个")
+    
+    # 按解析后的 IP:端口 合并节点，每个端点只测一次，结果分发给其下所有节点
+    # 双栈域名的候选地址按IPv4/IPv6交替排列，测速时竞速
+    endpoints = {}
+    unresolved = 0
+    unprobed = []
+    for node in nodes:
+        method = probe_method(node)
+        if method is None:
+            unprobed.append(node)
+            continue
+        candidates = tuple(resolver.interleave_addresses(
+            resolved.get(node.get('server', ''), []), HAPPY_EYEBALLS_MAX_ADDRESSES
+        ))
+        port = node.get('port', 0)
+        if not candidates or not port:
+            # 记为测速失败，连续失败后进入退避，不必每次运行都重新解析
+            node['_probe'] = failed_probe()
+            unresolved += 1
+            continue
+        endpoints.setdefault((candidates, port, method), []).append(node)
+    
+    concurrency = probe_concurrency(max_workers)
+    deadline = probe_deadline(timeout, max_latency)
+    print(f"开始测试 {len(nodes)} 个节点，合并为 {len(endpoints)} 个端点（并发上限 {concurrency}，单次连接截止 {deadline * 1000:.0f}ms）...")
+    if unresolved:
+        print(f"  ✗ {unresolved} 个节点无法解析或配置无效")
+    
+    scheduler = ProbeScheduler(concurrency)
+    
+    async def probe(endpoint):
+        candidates, port, method = endpoint
+        history = [node['_ewma'] for node in endpoints[endpoint] if node.get('_ewma') is not None]
+        async with scheduler.slot(candidates[0]):
+            return endpoint, await probe_endpoint(
+                candidates, port, deadline, max_latency, method=method,
+                feedback=scheduler.report, reference=min(history) if history else None
+            )
+    
+    tasks = [asyncio.ensure_future(probe(endpoint)) for endpoint in endpoints]
+    results = []
+    completed = 0
+    ipv6_wins = 0
+    
+    for coro in asyncio.as_completed(tasks):
+        try:
+            endpoint, stats = await coro
+        except asyncio.CancelledError:
+            continue
+        completed += 1
+        endpoint_nodes = endpoints[endpoint]
+        for node in endpoint_nodes:
+            node['_probe'] = stats
         
-        result = sock.connect_ex((server, port))
-        latency = (time.time() - start_time) * 1000  # 转换为毫秒
+        if stats['passed']:
+            score = probe_score(stats)
+            winner_family = resolver.address_family(stats['address'])
+            dual_stack = resolver.is_dual_stack(endpoint[0])
+            if winner_family == socket.AF_INET6:
+                ipv6_wins += 1
+            for node in endpoint_nodes:
+                node['latency'] = stats['median']
+                node['_score'] = score
+                node['_address'] = stats['address']
+                if dual_stack:
+                    # 双栈域名按竞速胜出的协议族设置客户端的IP偏好
+                    node['ip-version'] = 'ipv6-prefer' if winner_family == socket.AF_INET6 else 'ipv4-prefer'
+            results.extend(endpoint_nodes)
+            status = f"✓ 通过 ({stats['median']}ms, 抖动 {stats['jitter']}ms, 丢包 {stats['loss']:.0%})"
+        elif stats['median'] is not None:
+            status = f"✗ 延迟过高 ({stats['median']}ms, 丢包 {stats['loss']:.0%})"
+        else:
+            status = f"✗ 连接失败或超过 {deadline * 1000:.0f}ms"
         
-        sock.close()
+        address = stats['address'] or endpoint[0][0]
+        host = f"[{address}]" if ':' in address else address
+        label = f"{host}:{endpoint[1]}{'/udp' if endpoint[2][0] == 'quic' else ''} ({len(endpoint_nodes)} 个节点)"
+        print(f"  [{completed}/{len(endpoints)}] {label[:40]:<40} {status}")
         
-        if result == 0:  # 连接成功
-            return node, round(latency, 2)
-        else:
-            return node, None
-            
-    except socket.timeout:
-        return node, None
-    except Exception as e:
-        return node, None
+        if stop_after and len(results) >= stop_after:
+            remaining = [task for task in tasks if not task.done()]
+            if remaining:
+                print(f"  已确认 {len(results)} 个可用节点，取消剩余 {len(remaining)} 个端点的测速")
+                for task in remaining:
+                    task.cancel()
+                await asyncio.gather(*remaining, return_exceptions=True)
+            break
+    
+    # 保持输入顺序
+    order = {id(node): i for i, node in enumerate(nodes)}
+    results.sort(key=lambda node: order[id(node)])
+    print(f"\n测试完成！可用节点: {len(results)}/{len(nodes)}（{scheduler.summary()}）")
+    if unprobed:
+        # 无法判断是否可用，不当作失败丢弃，没有延迟，排序时排在最后
+        print(f"  ⚠️  {len(unprobed)} 个节点使用无法复现的UDP混淆，未测速直接保留")
+        results.extend(unprobed)
+    if ipv6_wins:
+        print(f"  {ipv6_wins} 个端点经IPv6连接胜出")
+    return results
 
-async def test_nodes_async(nodes, max_latency=500, timeout=5, max_workers=50):
-    """异步测试所有节点"""
-    print(f"开始测试 {len(nodes)} 个节点...")
+def test_nodes(nodes, max_latency=500, timeout=5, state=None, stop_after=PROBE_STOP_AFTER, shard=None):
+    """
+    测试节点延迟并过滤
     
-    # 使用线程池执行同步测速（避免某些网络库的异步问题）
-    loop = asyncio.get_event_loop()
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        tasks = [
-            loop.run_in_executor(executor, test_node_latency_sync, node, timeout)
-            for node in nodes
-        ]
-        
-        results = []
-        completed = 0
-        
-        for coro in asyncio.as_completed(tasks):
-            node, latency = await coro
-            completed += 1
+    传入NodeState时复用未变化节点在有效期内的测速结果；
+    shard为 (index, count) 时只测试按指纹哈希属于该分片的节点。
+    """
+    if shard is not None:
+        index, count = shard
+        nodes = select_shard(nodes, index, count)
+        print(f"分片 {index}/{count}：本分片 {len(nodes)} 个节点")
+    
+    reused = []
+    if state is not None:
+        to_test = []
+        reused_count = 0
+        backoff_count = 0
+        for node in nodes:
+            history = state.history_for(node)
+            node['_ewma'] = history['ewma'] if history else None
             
-            if latency is not None:
-                if latency <= max_latency:
-                    node['latency'] = latency
-                    results.append(node)
-                    status = "✓ 通过"
-                else:
-                    status = f"✗ 延迟过高 ({latency}ms)"
+            hit, result = state.fresh_probe(node, PROBE_FRESHNESS)
+            if hit:
+                reused_count += 1
+                if result is not None and result['latency'] <= max_latency:
+                    node['latency'] = result['latency']
+                    # 与本次测速的节点按同样的综合评分排序
+                    if result['score'] is not None:
+                        node['_score'] = result['score']
+                    if result['address']:
+                        node['_address'] = result['address']
+                    # 双栈节点沿用上次竞速胜出的协议族，避免输出的配置在两次运行间来回变化
+                    if result['ip_version']:
+                        node['ip-version'] = result['ip_version']
+                    reused.append(node)
+            elif state.in_backoff(node):
+                # 连续失败的节点按指数退避暂停测速
+                backoff_count += 1
             else:
-                status = "✗ 连接失败"
-            
-            node_name = node.get('name', 'Unknown')
-            print(f"  [{completed}/{len(nodes)}] {node_name[:40]:<40} {status}")
+                to_test.append(node)
+        print(f"复用 {reused_count} 个未变化节点的测速结果（其中 {len(reused)} 个可用），"
+              f"{backoff_count} 个连续失败节点处于退避期")
+        
+        # 历史上较快的节点优先测速，提前停止模式能更快找到好节点
+        to_test.sort(key=lambda node: node['_ewma'] if node['_ewma'] is not None else max_latency)
+        nodes = to_test
     
-    print(f"\n测试完成！可用节点: {len(results)}/{len(nodes)}")
-    return results
+    if stop_after:
+        # 复用的可用节点也计入目标数量
+        stop_after = max(1, stop_after - len(reused))
+    results = _run_tests(nodes, max_latency, timeout, stop_after) if nodes else []
+    
+    if state is not None:
+        # 只记录实际完成测速的节点（提前停止时被取消的节点不记录）
+        passed = set(id(node) for node in results if node.get('latency') is not None)
+        state.record_probes([
+            (node, node.get('latency') if id(node) in passed else None)
+            for node in nodes
+            if '_probe' in node or id(node) in passed
+        ])
+    
+    available = reused + results
+    if L7_PROBE_ENABLED and available:
+        available = l7_filter(available)
+    if PROBE_BACKEND == 'clash' and available:
+        available = clash_filter(available)
+    return available
+
+def clash_filter(nodes, top=CLASH_PROBE_TOP):
+    """
+    通过本地Clash内核对TCP测速通过的节点做端到端测速
+    
+    只保留内核测速成功的节点，排序评分改为端到端延迟；
+    控制器不可用时保留TCP测速结果。
+    """
+    candidates = sorted(nodes, key=lambda node: node.get('_score', node.get('latency', 9999)))
+    if top:
+        candidates = candidates[:top]
+    print(f"\nClash内核测速：{len(candidates)} 个候选节点...")
+    try:
+        delays = clash_probe.probe_nodes(candidates)
+    except clash_probe.ClashApiError as e:
+        print(f"  ⚠️  {str(e)}，保留TCP测速结果")
+        return nodes
+    
+    results = []
+    for node, delay in zip(candidates, delays):
+        if delay is not None:
+            node['_score'] = delay
+            results.append(node)
+    print(f"Clash内核测速完成：通过 {len(results)}/{len(candidates)}")
+    # 保持原有顺序
+    passed = set(id(node) for node in results)
+    return [node for node in nodes if id(node) in passed]
 
-def test_nodes(nodes, max_latency=500, timeout=5):
-    """测试节点延迟并过滤"""
+def l7_filter(nodes, top=L7_PROBE_TOP):
+    """对TCP测速排名靠前的节点做协议层测速，去掉握手或请求失败的节点"""
+    candidates = sorted(nodes, key=lambda node: node.get('_score', node.get('latency', 9999)))[:top]
+    print(f"\n协议层测速：TCP排名前 {len(candidates)} 个节点...")
+    loop = new_event_loop()
+    try:
+        outcomes = loop.run_until_complete(l7_probe.probe_nodes(candidates))
+    finally:
+        loop.close()
+    
+    failed = set()
+    passed = unsupported = 0
+    for node, outcome in zip(candidates, outcomes):
+        if outcome == l7_probe.UNSUPPORTED:
+            unsupported += 1
+        elif outcome is None:
+            failed.add(id(node))
+        else:
+            passed += 1
+    print(f"协议层测速完成：通过 {passed} 个，失败 {len(failed)} 个，不支持的协议 {unsupported} 个（保留TCP结果）")
+    return [node for node in nodes if id(node) not in failed]
+
+def _run_tests(nodes, max_latency, timeout, stop_after=0):
     # 运行异步测试
     try:
+        loop = new_event_loop()
         try:
-            loop = asyncio.get_event_loop()
-            if loop.is_closed():
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        
-        results = loop.run_until_complete(
-            test_nodes_async(nodes, max_latency, timeout)
-        )
-        return results
+            return loop.run_until_complete(
+                test_nodes_async(nodes, max_latency, timeout, stop_after=stop_after)
+            )
+        finally:
+            loop.close()
+            resolver.get_dns_cache().save()
     except Exception as e:
         print(f"异步测试失败，尝试同步测试: {str(e)}")
         # 如果异步失败，使用同步方式
         return test_nodes_sync(nodes, max_latency, timeout)
 
 def test_nodes_sync(nodes, max_latency=500, timeout=5):
-    """同步测试节点（备用方案）"""
-    print(f"开始测试 {len(nodes)} 个节点（同步模式）...")
+    """同步测试节点（备用方案），与异步测速使用相同的单次连接截止时间"""
+    deadline = probe_deadline(timeout, max_latency)
+    print(f"开始测试 {len(nodes)} 个节点（同步模式，单次连接截止 {deadline * 1000:.0f}ms）...")
     results = []
     
     for i, node in enumerate(nodes, 1):
@@ -141,30 +523,35 @@ def test_nodes_sync(nodes, max_latency=500, timeout=5):
             print(f"  [{i}/{len(nodes)}] {node_name[:40]:<40} ✗ 配置无效")
             continue
         
-        try:
-            start_time = time.time()
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(timeout)
-            
-            result = sock.connect_ex((server, port))
-            latency = (time.time() - start_time) * 1000
-            
-            sock.close()
-            
-            if result == 0 and latency <= max_latency:
-                node['latency'] = round(latency, 2)
-                results.append(node)
-                print(f"  [{i}/{len(nodes)}] {node_name[:40]:<40} ✓ 通过 ({node['latency']}ms)")
-            elif result == 0:
-                print(f"  [{i}/{len(nodes)}] {node_name[:40]:<40} ✗ 延迟过高 ({latency:.0f}ms)")
-            else:
-                print(f"  [{i}/{len(nodes)}] {node_name[:40]:<40} ✗ 连接失败")
-                
-        except socket.timeout:
-            print(f"  [{i}/{len(nodes)}] {node_name[:40]:<40} ✗ 超时")
-        except Exception as e:
-            print(f"  [{i}/{len(nodes)}] {node_name[:40]:<40} ✗ 错误: {str(e)[:20]}")
+        method = probe_method(node)
+        if method is None:
+            results.append(node)
+            print(f"  [{i}/{len(nodes)}] {node_name[:40]:<40} ⚠️  UDP混淆无法复现，未测速直接保留")
+            continue
+        
+        # 先解析域名，计时只包含连接本身
+        addresses = resolver.interleave_addresses(resolver.resolve_host_sync(server), HAPPY_EYEBALLS_MAX_ADDRESSES)
+        if not addresses:
+            node['_probe'] = failed_probe()
+            print(f"  [{i}/{len(nodes)}] {node_name[:40]:<40} ✗ 无法解析")
+            continue
+        
+        latency, address = measure_latency_sync(addresses, port, deadline, method)
+        passed = latency is not None and latency <= max_latency
+        node['_probe'] = dict(latency_stats([latency] if latency is not None else [], 1),
+                              passed=passed, address=address)
+        label = ', UDP' if method[0] == 'quic' else ''
+        if passed:
+            node['latency'] = latency
+            node['_address'] = address
+            results.append(node)
+            print(f"  [{i}/{len(nodes)}] {node_name[:40]:<40} ✓ 通过 ({latency}ms{label})")
+        elif latency is not None:
+            print(f"  [{i}/{len(nodes)}] {node_name[:40]:<40} ✗ 延迟过高 ({latency:.0f}ms{label})")
+        else:
+            print(f"  [{i}/{len(nodes)}] {node_name[:40]:<40} ✗ 连接失败或超过 {deadline * 1000:.0f}ms")
     
+    resolver.get_dns_cache().save()
     print(f"\n测试完成！可用节点: {len(results)}/{len(nodes)}")
     return results
 